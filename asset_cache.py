@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from PIL import Image, ImageFont
+import os
+import threading
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+class LogoCache:
+    # Resized logos (and their alpha masks) ready to paste, keyed on
+    # (path, mtime, size, resample) with LRU eviction under a memory cap.
+    # Every process owns its own instance, so pool workers each warm up once.
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, logo_path, size, resample=None):
+        key = (os.path.abspath(logo_path), os.path.getmtime(logo_path), tuple(size), resample)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0], entry[1]
+
+        logo, mask = self._load(logo_path, tuple(size), resample)
+        nbytes = _image_bytes(logo) + (_image_bytes(mask) if mask is not None else 0)
+        if nbytes > self.max_bytes:
+            # Too big to keep around; hand it out uncached
+            return logo, mask
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (logo, mask, nbytes)
+                self._bytes += nbytes
+                self._evict()
+        return logo, mask
+
+    def _load(self, logo_path, size, resample):
+        with Image.open(logo_path) as logo:
+            # Keep Pillow's default filter unless one is asked for explicitly
+            logo = logo.resize(size) if resample is None else logo.resize(size, resample)
+        # Handle logo transparency
+        mask = logo.split()[3] if logo.mode == 'RGBA' else None
+        return logo, mask
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+class FontCache:
+    # Loaded TrueType fonts keyed on (font_path, size), plus measured text
+    # bounding boxes keyed on (text, font_path, size, font mode), so a batch
+    # loads each TTF once and measures each signature once.
+    def __init__(self, max_fonts=32, max_layouts=256):
+        self.max_fonts = max_fonts
+        self.max_layouts = max_layouts
+        self._fonts = OrderedDict()
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def font(self, font_path, size):
+        key = (font_path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+        font = ImageFont.truetype(font_path, size)
+        with self._lock:
+            self._fonts[key] = font
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def textbbox(self, draw, text, font_path, size):
+        # Measured at the origin, exactly as draw.textbbox((0, 0), ...) would
+        key = (text, font_path, size, draw.fontmode)
+        with self._lock:
+            bbox = self._layouts.get(key)
+            if bbox is not None:
+                self._layouts.move_to_end(key)
+                return bbox
+        bbox = draw.textbbox((0, 0), text, font=self.font(font_path, size))
+        with self._lock:
+            self._layouts[key] = bbox
+            while len(self._layouts) > self.max_layouts:
+                self._layouts.popitem(last=False)
+        return bbox
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._layouts.clear()
+
+logo_cache = LogoCache()
+font_cache = FontCache()
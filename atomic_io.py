@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+import os
+import threading
+
+# Temp-file-and-rename writes, shared by image outputs, presets, settings,
+# thumbnails and the batch manifest. Depends on nothing else in the project,
+# so any module can use it without import cycles.
+
+@contextmanager
+def atomic_output(path, sync=False):
+    # Yields a file in the same folder as path that replaces it on success, so
+    # readers never see a half-written output. The temp name is hidden, unique
+    # per process and thread, and has no image extension, so folder scans skip
+    # it and concurrent writers never share one.
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_atomic(path, data, sync=False):
+    with atomic_output(path, sync) as f:
+        f.write(data)
@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+import importlib.util
+import threading
+
+# Optional and slow to import; NumpyBackend imports it on first use, so
+# Pillow-only runs never pay for it
+numpy = None
+
+class PillowBackend:
+    # Compositing primitives used by RenderPlan. A canvas is whatever
+    # new_canvas returns; RenderPlan only reads its size and mode and hands
+    # it back to these methods.
+    name = "pillow"
+
+    def supports(self, mode):
+        return True
+
+    def new_canvas(self, mode, size, photo=None, position=(0, 0)):
+        # White canvas, with photo pasted at position if given
+        canvas = Image.new(mode, size, 'white')
+        if photo is not None:
+            canvas.paste(photo, position)
+        return canvas
+
+    def paste(self, canvas, img, position):
+        canvas.paste(img, position)
+
+    def blend(self, canvas, img, position, mask):
+        # Pastes img through an "L" mask (or plainly without one)
+        canvas.paste(img, position, mask)
+
+    def text_draw(self, canvas):
+        # An ImageDraw for measuring text as it would be drawn on canvas
+        return ImageDraw.Draw(canvas)
+
+    def draw_text(self, canvas, draw, position, text, font, fill):
+        draw.text(position, text, fill=fill, font=font)
+
+    def to_image(self, canvas):
+        return canvas
+
+    def encode(self, img, fp, fmt, **kwargs):
+        img.save(fp, format=fmt, **kwargs)
+
+    def render_batch(self, plan, images, timer):
+        return [plan.render(img, timer, self) for img in images]
+
+# Extra array dimension per supported mode, as Pillow lays the pixels out
+# in memory. Image.new(mode, size, 'white') sets every byte to 255 in all
+# of them (CMYK included).
+STORAGE = {"L": (), "RGB": (4,), "RGBA": (4,), "CMYK": (4,)}
+
+def _map_image(array, mode):
+    # A writable Pillow image over the array's memory. This leans on Pillow
+    # internals (mapped frombuffer images, ImagingCore.setmode), so
+    # requirements.txt pins the tested Pillow versions and NumpyBackend
+    # checks the mapping works before it is used.
+    height, width = array.shape[:2]
+    if mode == "RGB":
+        # Pillow only maps 4-byte RGBX buffers; RGB uses the same layout
+        view = Image.frombuffer(mode, (width, height), array, "raw", "RGBX", 0, 1)
+        view.im.setmode("RGB")
+        image = view._new(view.im)
+    else:
+        image = Image.frombuffer(mode, (width, height), array, "raw", mode, 0, 1)
+    image.readonly = 0
+    return image
+
+def _maps_writable():
+    # Whether drawing on a mapped image changes the array under it, for
+    # every mode the backend handles
+    for mode, bands in STORAGE.items():
+        array = numpy.zeros((2, 3) + bands, numpy.uint8)
+        canvas = ArrayCanvas(array, mode)
+        try:
+            canvas.image.paste(Image.new(mode, (1, 1), 'white'), (1, 1))
+        except (AttributeError, ValueError):
+            return False
+        if canvas.image.mode != mode or canvas.image.size != (3, 2) or not canvas.pixels[1, 1].all() or canvas.pixels[0, 0].any():
+            return False
+    return True
+
+class ArrayCanvas:
+    # A canvas held in a NumPy array, with a Pillow image mapped onto the
+    # same memory, so both can draw on it without copies
+    def __init__(self, array, mode):
+        self.array = array
+        self.mode = mode
+        self.image = _map_image(array, mode)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def pixels(self):
+        # The array without RGB's padding byte
+        return self.array[..., :3] if self.mode == "RGB" else self.array
+
+def _clip(canvas_size, size, position):
+    # The part of a size-sized paste at position that lands on the canvas,
+    # as ((x0, y0, x1, y1) on the canvas, (x, y) offset into the source)
+    x, y = position
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + size[0], canvas_size[0]), min(y + size[1], canvas_size[1])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1), (x0 - x, y0 - y)
+
+class NumpyBackend(PillowBackend):
+    # Canvases live in preallocated NumPy buffers. The border fill, the
+    # bottom strip of a batch and alpha-blended logos are vectorized array
+    # operations, the blend rounded exactly like Pillow's, so output is
+    # pixel-identical. Photos are pasted and text drawn by Pillow straight
+    # into the same memory. Other modes stay on Pillow.
+    name = "numpy"
+
+    def __init__(self, max_arrays=8):
+        global numpy
+        try:
+            import numpy
+        except ImportError:
+            raise ValueError("the numpy backend needs NumPy installed") from None
+        if not _maps_writable():
+            raise ValueError(f"the numpy backend doesn't support Pillow {Image.__version__}; use the pillow backend")
+        self.max_arrays = max_arrays
+        # Arrays of recently used overlays (logos, masks, bottom strips)
+        self._arrays = OrderedDict()
+        self._lock = threading.Lock()
+
+    def supports(self, mode):
+        return mode in STORAGE
+
+    def _array(self, img):
+        # numpy.asarray copies the whole image; keep the last few
+        key = id(img)
+        with self._lock:
+            entry = self._arrays.get(key)
+            if entry is not None and entry[0] is img:
+                self._arrays.move_to_end(key)
+                return entry[1]
+        array = numpy.asarray(img)
+        with self._lock:
+            # Holding img keeps its id from being reused
+            self._arrays[key] = (img, array)
+            while len(self._arrays) > self.max_arrays:
+                self._arrays.popitem(last=False)
+        return array
+
+    def frames(self, mode, count, size, photos=(), position=(0, 0)):
+        # count canvases sharing one (count, height, width[, 4]) buffer, each
+        # white with its photo at position. Only the border is filled.
+        width, height = size
+        buffer = numpy.empty((count, height, width) + STORAGE[mode], numpy.uint8)
+        if photos:
+            x, y = position
+            photo_width, photo_height = photos[0].size
+            buffer[:, :y] = 255
+            buffer[:, y + photo_height:] = 255
+            buffer[:, y:y + photo_height, :x] = 255
+            buffer[:, y:y + photo_height, x + photo_width:] = 255
+        else:
+            buffer[...] = 255
+        canvases = [ArrayCanvas(buffer[index], mode) for index in range(count)]
+        for canvas, photo in zip(canvases, photos):
+            canvas.image.paste(photo, position)
+        return buffer, canvases
+
+    def new_canvas(self, mode, size, photo=None, position=(0, 0)):
+        return self.frames(mode, 1, size, [photo] if photo is not None else (), position)[1][0]
+
+    def paste(self, canvas, img, position):
+        canvas.image.paste(img, position)
+
+    def blend(self, canvas, img, position, mask):
+        clipped = _clip(canvas.size, img.size, position)
+        if mask is None or mask.mode != "L" or clipped is None or (canvas.mode == "RGB" and img.mode in ("LA", "RGBa")):
+            canvas.image.paste(img, position, mask)
+            return
+        # Like Pillow, paste RGBA onto RGB as it is and convert anything else
+        source = img if img.mode == canvas.mode or (canvas.mode == "RGB" and img.mode == "RGBA") else img.convert(canvas.mode)
+        (x0, y0, x1, y1), (sx, sy) = clipped
+        src = self._array(source)[sy:sy + y1 - y0, sx:sx + x1 - x0]
+        dst = canvas.pixels[y0:y1, x0:x1]
+        src = src[..., :dst.shape[-1]] if dst.ndim == 3 else src
+        alpha = self._array(mask)[sy:sy + y1 - y0, sx:sx + x1 - x0].astype(numpy.uint16)
+        if dst.ndim == 3:
+            alpha = alpha[..., None]
+        # Pillow's BLEND: DIV255(out * (255 - a) + in * a), which fits in 16 bits
+        tmp = dst * (255 - alpha) + src * alpha + 128
+        dst[...] = ((tmp >> 8) + tmp) >> 8
+
+    def text_draw(self, canvas):
+        return ImageDraw.Draw(canvas.image)
+
+    def to_image(self, canvas):
+        return canvas.image
+
+    def render_batch(self, plan, images, timer):
+        # Same-size images of one mode share a single buffer: the border is
+        # filled and the bottom strip copied for all of them at once
+        results = [None] * len(images)
+        groups = OrderedDict()
+        for index, img in enumerate(images):
+            groups.setdefault((img.size, img.mode), []).append(index)
+        for (size, mode), indices in groups.items():
+            width, height = plan.canvas_size(*size)
+            strip = plan.bottom_strip(width, mode, self) if plan.has_overlay and self.supports(mode) else None
+            if len(indices) == 1 or not self.supports(mode) or (plan.has_overlay and strip is None):
+                for index in indices:
+                    results[index] = plan.render(images[index], timer, self)
+                continue
+            photos = [images[index] for index in indices]
+            with timer.stage("canvas", len(indices) * width * height * Image.getmodebands(mode)):
+                buffer, canvases = self.frames(mode, len(indices), (width, height), photos, (plan.border_width, plan.border_width))
+            if strip is not None:
+                with timer.stage("strip"):
+                    rows = buffer[:, height - strip.height:]
+                    if mode == "RGB":
+                        rows = rows[..., :3]
+                    rows[...] = self._array(strip)
+            for canvas, index in zip(canvases, indices):
+                results[index] = canvas.image
+        return results
+
+PILLOW = PillowBackend()
+BACKENDS = {"pillow": PillowBackend, "numpy": NumpyBackend}
+_instances = {"pillow": PILLOW}
+
+def get_backend(name=None):
+    # One shared instance per backend name; None or "" is Pillow
+    name = (name or "pillow").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend {name!r} (available: {', '.join(BACKENDS)})")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+def available_backends():
+    # Without importing NumPy
+    return [name for name in BACKENDS if name != "numpy" or importlib.util.find_spec("numpy") is not None]
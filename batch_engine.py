@@ -0,0 +1,239 @@
+from instrumentation import NULL_TIMER, StageTimer
+from pic_border_UI import BorderPresetManager
+from discovery import PathFeed, mirror_folder
+from governor import AdmissionQueue, JobEstimator, MemoryGovernor
+import os
+import threading
+
+# Per-process preset manager, created once by the pool initializer
+_worker_manager = None
+
+def _init_worker(presets, memory_budget=None, backend=None):
+    global _worker_manager
+    _worker_manager = BorderPresetManager(presets, memory_budget, backend)
+
+def _process_image(preset_name, image_path, logo_path, output_folder, delete_input, profile=False, renditions=None):
+    # Returns (image_path, error, timing record or None)
+    timer = StageTimer(image_path) if profile else NULL_TIMER
+    error = None
+    try:
+        if renditions:
+            _worker_manager.apply_renditions(renditions, image_path, logo_path, output_folder, delete_input, timer)
+        else:
+            _worker_manager.apply_preset(preset_name, image_path, logo_path, output_folder, delete_input, timer)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return image_path, error, timer.record(error) if profile else None
+
+def _render_image(preset_name, image_path, data, logo_path, profile=False, renditions=None):
+    # In-memory counterpart of _process_image for the I/O pipeline; returns
+    # (image_path, error, [(output name, bytes)], timing record or None)
+    timer = StageTimer(image_path) if profile else NULL_TIMER
+    try:
+        outputs = _worker_manager.render_outputs(preset_name, data, image_path, logo_path, renditions, timer)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return image_path, error, [], timer.record(error) if profile else None
+    return image_path, None, outputs, timer.record() if profile else None
+
+def _render_bytes(preset_name, data, logo_path, fmt=None):
+    # Worker side of the render service: (output format, encoded bytes);
+    # errors propagate through the future
+    return _worker_manager.render_encoded(preset_name, data, logo_path, fmt)
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+class BatchEngine:
+    def __init__(self, presets, workers=None, memory_budget=None, io_threads=0, prefetch=None, ram_budget=None, backend=None):
+        self.presets = presets
+        self.workers = max(1, workers or default_worker_count())
+        # Per-worker canvas budget in bytes, see BorderPresetManager
+        self.memory_budget = memory_budget
+        # With io_threads > 0, reads and writes run on threads of their own
+        # (see pipeline.IOPipeline), with up to prefetch files in memory
+        self.io_threads = io_threads
+        self.prefetch = prefetch
+        # With ram_budget (bytes), files are only started while the estimated
+        # peak memory of everything running fits, see governor.py
+        self.ram_budget = ram_budget
+        # Compositing backend name, see backends.py
+        self.backend = backend
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self, preset_name, image_paths, logo_path, output_folder, delete_input=False, progress_callback=None, manifest=None, profiler=None,
+            renditions=None, input_root=None):
+        # Returns a list of (image_path, error) for every file that failed.
+        # image_paths may be a list or any iterable, e.g. a streaming
+        # discovery.scan_images(); processing starts right away and the total
+        # passed to progress_callback grows until discovery is complete.
+        # With input_root, outputs mirror the input's subfolders under
+        # output_folder.
+        # With a BatchManifest, files whose outputs are up to date are skipped.
+        # With an instrumentation.Profiler, per-stage timings are collected and
+        # a report is written to the output folder. With a list of
+        # fanout.Rendition, each input is decoded once and written once per
+        # rendition; preset_name is then ignored.
+        if renditions and manifest is not None:
+            raise ValueError("the manifest tracks single-preset batches only")
+        errors = []
+        self._cancel_event.clear()
+        if manifest is not None:
+            image_paths = manifest.pending(preset_name, self.presets[preset_name], image_paths, logo_path, input_root)
+        feed = PathFeed(image_paths)
+        folder_for = self._folder_for(output_folder, input_root)
+        results = self._results(preset_name, feed, logo_path, folder_for, delete_input, profiler is not None, renditions)
+        try:
+            for done, (image_path, error, record) in enumerate(results, start=1):
+                if record is not None:
+                    profiler.add(record)
+                if error is not None:
+                    errors.append((image_path, error))
+                elif manifest is not None:
+                    manifest.record(image_path)
+                if progress_callback:
+                    progress_callback(done, feed.found)
+        finally:
+            # Stops the workers' feed right away if the loop above failed
+            # (e.g. Ctrl-C or a progress_callback error), not at garbage collection
+            results.close()
+            feed.close()
+            if manifest is not None:
+                manifest.save()
+            if profiler is not None:
+                profiler.write_report(output_folder)
+        return errors
+
+    @staticmethod
+    def _folder_for(output_folder, input_root):
+        # Maps an input to its output folder, creating mirrored subfolders
+        # the first time they are needed
+        if not input_root:
+            return lambda image_path: output_folder
+        created = set()
+        def folder_for(image_path):
+            folder = mirror_folder(image_path, input_root, output_folder)
+            if folder not in created:
+                os.makedirs(folder, exist_ok=True)
+                created.add(folder)
+            return folder
+        return folder_for
+
+    def _results(self, preset_name, feed, logo_path, folder_for, delete_input, profile, renditions):
+        governor = MemoryGovernor(self.ram_budget)
+        estimate = None
+        if self.ram_budget:
+            # The pipeline renders in memory, so nothing is streamed there
+            estimator = JobEstimator(self.presets, preset_name, logo_path, renditions, None if self.io_threads else self.memory_budget)
+            estimate = estimator.estimate
+        if self.io_threads:
+            from concurrent.futures import ProcessPoolExecutor
+            from concurrent.futures.process import BrokenProcessPool
+            from pipeline import IOPipeline
+            def new_pool():
+                return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.presets, self.memory_budget, self.backend))
+            pools = [new_pool()]
+            def submit(image_path, data):
+                # Only called from the pipeline's dispatcher thread. Files on a
+                # pool a worker died in fail with it; later ones get a new pool.
+                try:
+                    return pools[-1].submit(_render_image, preset_name, image_path, data, logo_path, profile, renditions)
+                except BrokenProcessPool:
+                    pools.append(new_pool())
+                    return pools[-1].submit(_render_image, preset_name, image_path, data, logo_path, profile, renditions)
+            try:
+                pipeline = IOPipeline(submit, folder_for, delete_input, self.io_threads, self.prefetch, lambda: self.cancelled, governor, estimate)
+                yield from pipeline.results(feed)
+            finally:
+                for pool in pools:
+                    pool.shutdown(wait=True)
+            return
+
+        if self.workers == 1 or (feed.complete and feed.found <= 1):
+            # No pool start-up for a single worker or a single file
+            _init_worker(self.presets, self.memory_budget, self.backend)
+            for image_path in feed:
+                if self.cancelled:
+                    return
+                yield _process_image(preset_name, image_path, logo_path, folder_for(image_path), delete_input, profile, renditions)
+            return
+
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        from concurrent.futures.process import BrokenProcessPool
+        # At least one: discovery may have finished with nothing found since
+        # the check above (an empty tree, or everything skipped by a manifest)
+        workers = max(1, min(self.workers, feed.found)) if feed.complete else self.workers
+        def new_pool():
+            return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self.presets, self.memory_budget, self.backend))
+        executor = new_pool()
+        try:
+            # Keep a few files queued per worker rather than submitting the
+            # whole batch up front, which would not work for a streamed scan.
+            # Under a RAM budget only as many as can run are submitted, so the
+            # admitted estimates match what is actually in memory.
+            jobs = AdmissionQueue(feed, governor, estimate or (lambda image_path: 0), workers * 2)
+            limit = workers if self.ram_budget else workers * 2
+            in_flight = {}
+            # A job taken while the pool was breaking, to resubmit on the new one
+            retry = []
+            def submit():
+                while len(in_flight) < limit:
+                    job = retry.pop() if retry else jobs.take()
+                    if job is None:
+                        return
+                    image_path, cost = job
+                    try:
+                        future = executor.submit(_process_image, preset_name, image_path, logo_path, folder_for(image_path), delete_input, profile, renditions)
+                    except BrokenProcessPool:
+                        retry.append(job)
+                        return
+                    in_flight[future] = job
+            def finish(future):
+                # The worker's result, or the failure of the worker itself
+                # (e.g. killed for memory or crashed in a decoder)
+                image_path, cost = in_flight.pop(future)
+                governor.release(cost)
+                try:
+                    return future.result(), False
+                except BrokenProcessPool as e:
+                    return (image_path, f"{type(e).__name__}: {e}", None), True
+                except Exception as e:
+                    return (image_path, f"{type(e).__name__}: {e}", None), False
+            submit()
+            while in_flight or retry:
+                broken = bool(retry)
+                if in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        result, died = finish(future)
+                        broken = broken or died
+                        yield result
+                        if self.cancelled:
+                            # Drop queued work; files already running are allowed
+                            # to finish and are reported, since their outputs
+                            # (and with delete_input, deleted inputs) are real
+                            for future in list(in_flight):
+                                if future.cancel():
+                                    governor.release(in_flight.pop(future)[1])
+                            wait(in_flight)
+                            for future in list(in_flight):
+                                yield finish(future)[0]
+                            return
+                if broken:
+                    # A dead worker takes the pool and every file still on it
+                    # down; report those and carry on with a fresh pool
+                    wait(in_flight)
+                    for future in list(in_flight):
+                        yield finish(future)[0]
+                    executor.shutdown(wait=True)
+                    executor = new_pool()
+                submit()
+        finally:
+            executor.shutdown(wait=True)
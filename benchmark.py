@@ -0,0 +1,292 @@
+from PIL import Image, ImageDraw
+from backends import available_backends, get_backend
+from instrumentation import NULL_TIMER
+from render_plan import RenderPlan
+from batch_engine import BatchEngine, default_worker_count
+from pic_border_UI import BorderPresetManager, default_presets
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (format, mode) pairs to generate; JPEG has no alpha or palette modes
+FORMATS = [("JPEG", "RGB"), ("JPEG", "L"), ("PNG", "RGB"), ("PNG", "RGBA"), ("PNG", "L"), ("PNG", "P")]
+DEFAULT_SIZES = [0.3, 2, 12]
+ALL_SIZES = [0.3, 2, 12, 24, 50, 100]
+BENCH_MODES = ("single", "batch", "parallel")
+
+# The bundled DejaVu Sans first, so results don't depend on installed fonts
+FONT_CANDIDATES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf"),
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+def find_font(font_path=None):
+    for candidate in ([font_path] if font_path else FONT_CANDIDATES):
+        if os.path.isfile(candidate):
+            return candidate
+    raise SystemExit("error: no TrueType font found; pass one with --font")
+
+def dimensions(megapixels):
+    # 3:2 landscape, like most camera output
+    width = int((megapixels * 1e6 * 1.5) ** 0.5)
+    return width, int(width / 1.5)
+
+def synthetic_image(size, mode):
+    # Gradients plus noise, so encoders see something closer to a photo than a flat fill
+    width, height = size
+    red = Image.linear_gradient("L").resize(size)
+    green = Image.radial_gradient("L").resize(size)
+    blue = Image.effect_noise(size, 64)
+    img = Image.merge("RGB", (red, green, blue))
+    if mode == "RGBA":
+        img.putalpha(Image.linear_gradient("L").rotate(90).resize(size))
+    elif mode != "RGB":
+        img = img.convert(mode)
+    return img
+
+def synthetic_logo(path):
+    logo = Image.new("RGBA", (690, 300), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(logo)
+    draw.ellipse((10, 10, 290, 290), fill=(200, 30, 30, 255))
+    draw.rectangle((320, 80, 680, 220), fill=(30, 30, 200, 160))
+    logo.save(path)
+
+def make_inputs(folder, megapixels, fmt, mode, count):
+    img = synthetic_image(dimensions(megapixels), mode)
+    ext = ".jpg" if fmt == "JPEG" else ".png"
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"bench_{i:04d}{ext}")
+        img.save(path, fmt)
+        paths.append(path)
+    return paths
+
+def peak_rss():
+    # Peak resident set size in bytes of this process or any finished child
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def case_fields(case, workers):
+    bench_mode, preset_name, fmt, mode, megapixels, count, backend = case
+    return {
+        "mode": bench_mode,
+        "backend": backend,
+        "preset": preset_name,
+        "format": fmt,
+        "image_mode": mode,
+        "megapixels": megapixels,
+        "images": count,
+        "workers": workers if bench_mode == "parallel" else 1,
+    }
+
+def run_case(case, presets, logo_path, workers):
+    # Runs one benchmark case in the current process and returns its metrics
+    bench_mode, preset_name, fmt, mode, megapixels, count, backend = case
+    work_dir = tempfile.mkdtemp(prefix="border_bench_")
+    try:
+        input_dir = os.path.join(work_dir, "in")
+        output_dir = os.path.join(work_dir, "out")
+        os.makedirs(input_dir)
+        os.makedirs(output_dir)
+        image_paths = make_inputs(input_dir, megapixels, fmt, mode, count)
+        latencies = []
+        errors = []
+        # Backend set-up (e.g. importing NumPy) happens before the clock
+        # starts; parallel workers still set up their own
+        get_backend(backend)
+        if bench_mode == "single":
+            manager = BorderPresetManager(presets, backend=backend)
+        start = time.perf_counter()
+        if bench_mode == "single":
+            for image_path in image_paths:
+                t = time.perf_counter()
+                manager.apply_preset(preset_name, image_path, logo_path, output_dir)
+                latencies.append(time.perf_counter() - t)
+        else:
+            engine = BatchEngine(presets, 1 if bench_mode == "batch" else workers, backend=backend)
+            errors = engine.run(preset_name, image_paths, logo_path, output_dir)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = dict(case_fields(case, workers), **{
+        "errors": len(errors),
+        "seconds": round(elapsed, 4),
+        "images_per_second": round(count / elapsed, 3),
+        "megapixels_per_second": round(count * megapixels / elapsed, 3),
+        "peak_rss_bytes": peak_rss(),
+    })
+    if latencies:
+        result["latency_p50_ms"] = round(percentile(latencies, 0.5) * 1000, 2)
+        result["latency_p95_ms"] = round(percentile(latencies, 0.95) * 1000, 2)
+    return result
+
+def _case_in_child(results, case, presets, logo_path, workers):
+    results.put(run_case(case, presets, logo_path, workers))
+
+def run_isolated(case, presets, logo_path, workers):
+    # A fresh process per case keeps peak RSS and warm caches from leaking between cases
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=_case_in_child, args=(results, case, presets, logo_path, workers))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # The child is gone; anything it sent before exiting is readable by now
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            # E.g. killed for memory on the largest sizes
+            result = dict(case_fields(case, workers), failed=f"benchmark process exited with code {process.exitcode}")
+        break
+    process.join()
+    return result
+
+def case_key(result):
+    # Reports from before backends were selectable ran on Pillow
+    return "|".join(str(result.get(name, "pillow")) for name in ("mode", "backend", "preset", "format", "image_mode", "megapixels", "images", "workers"))
+
+def check_parity(presets, preset_names, pairs, sizes, logo_path, backends):
+    # Renders every preset, mode and size with each backend and compares the
+    # pixels with Pillow's; returns the cases that differ. Each render gets a
+    # fresh plan so the cached bottom strip is built by that backend too.
+    mismatches = []
+    for megapixels in sizes:
+        for fmt, mode in pairs:
+            img = synthetic_image(dimensions(megapixels), mode)
+            for preset_name in preset_names:
+                expected = RenderPlan.from_preset(presets[preset_name], logo_path).render(img).tobytes()
+                for name in backends:
+                    backend = get_backend(name)
+                    outputs = {
+                        "render": [RenderPlan.from_preset(presets[preset_name], logo_path).render(img, backend=backend)],
+                        "render_batch": backend.render_batch(RenderPlan.from_preset(presets[preset_name], logo_path), [img, img], NULL_TIMER),
+                    }
+                    for call, images in outputs.items():
+                        if any(output.tobytes() != expected for output in images):
+                            mismatches.append({"backend": name, "call": call, "preset": preset_name, "image_mode": mode, "megapixels": megapixels})
+    return mismatches
+
+def compare(results, baseline, tolerance):
+    # Cases whose throughput dropped more than tolerance below the baseline
+    previous = {case_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None or "failed" in old:
+            continue
+        if "failed" in result:
+            regressions.append({"case": case_key(result), "failed": result["failed"]})
+            continue
+        ratio = result["images_per_second"] / old["images_per_second"]
+        result["baseline_ratio"] = round(ratio, 3)
+        if ratio < 1 - tolerance:
+            regressions.append({"case": case_key(result), "ratio": round(ratio, 3),
+                                "images_per_second": result["images_per_second"], "baseline_images_per_second": old["images_per_second"]})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark apply_preset on synthetic images.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help=f"megapixels to test (default: {DEFAULT_SIZES}; full range: {ALL_SIZES})")
+    parser.add_argument("--formats", nargs="+", default=[f"{fmt}:{mode}" for fmt, mode in FORMATS], help="FORMAT:MODE pairs, e.g. JPEG:RGB PNG:RGBA")
+    parser.add_argument("--presets", nargs="+", default=None, help="preset names (default: every built-in preset)")
+    parser.add_argument("--modes", nargs="+", choices=BENCH_MODES, default=list(BENCH_MODES))
+    parser.add_argument("--backends", nargs="+", choices=available_backends(), default=["pillow"], help="compositing backends to measure (default: pillow)")
+    parser.add_argument("--check-parity", action="store_true", help="first check that every backend renders the same pixels as Pillow; differences make the exit code non-zero")
+    parser.add_argument("--images", type=int, default=8, help="images per case")
+    parser.add_argument("-j", "--jobs", type=int, default=default_worker_count(), help="workers for the parallel mode")
+    parser.add_argument("--font", default=None, help="TrueType font for signature presets")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="compare against a previously saved report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed throughput drop before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    font_path = find_font(args.font)
+    presets = default_presets()
+    for preset in presets.values():
+        preset["font_path"] = font_path
+        # The built-in presets leave some signature text empty
+        if not preset["signature_text"]:
+            preset["signature_text"] = "Benchmark Signature"
+    preset_names = args.presets or list(presets)
+
+    asset_dir = tempfile.mkdtemp(prefix="border_bench_assets_")
+    logo_path = os.path.join(asset_dir, "logo.png")
+    synthetic_logo(logo_path)
+
+    pairs = [tuple(pair.split(":")) for pair in args.formats]
+    results = []
+    mismatches = []
+    try:
+        if args.check_parity:
+            mismatches = check_parity(presets, preset_names, pairs, args.sizes, logo_path, args.backends)
+            for mismatch in mismatches:
+                print(f"parity mismatch: {mismatch}", file=sys.stderr)
+        for megapixels in args.sizes:
+            for fmt, mode in pairs:
+                for preset_name in preset_names:
+                    for bench_mode in args.modes:
+                        for backend in args.backends:
+                            case = (bench_mode, preset_name, fmt, mode, megapixels, args.images, backend)
+                            result = run_isolated(case, presets, logo_path, args.jobs)
+                            if "failed" in result:
+                                print(f"{case_key(result)}: failed: {result['failed']}", file=sys.stderr)
+                            else:
+                                print(f"{case_key(result)}: {result['images_per_second']} img/s", file=sys.stderr)
+                            results.append(result)
+    finally:
+        shutil.rmtree(asset_dir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "pillow": Image.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if args.check_parity:
+        report["parity_mismatches"] = mismatches
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    failed = any("failed" in result for result in results)
+    return 1 if regressions or mismatches or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+from fnmatch import fnmatchcase
+from queue import Queue
+import os
+import threading
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def _matches(rel_path, name, patterns):
+    # Patterns containing a slash are matched against the path relative to
+    # the scan root, others against the file or folder name alone. Matching
+    # ignores case, like the extension check.
+    return any(fnmatchcase((rel_path if "/" in pattern else name).lower(), pattern.lower()) for pattern in patterns)
+
+def scan_images(root, recursive=True, include=None, exclude=None, skip=(), extensions=IMAGE_EXTENSIONS):
+    # Yields image paths under root as they are found, one directory at a
+    # time, so callers can start before a large tree has been listed.
+    # Extensions match case-insensitively. Excluded folders are not entered,
+    # nor are the folders in skip (e.g. an output folder inside the input)
+    # or symlinked folders, which could loop.
+    include = list(include or [])
+    exclude = list(exclude or [])
+    skip = {os.path.normcase(os.path.abspath(path)) for path in skip}
+    stack = [(root, "")]
+    while stack:
+        folder, rel_folder = stack.pop()
+        with os.scandir(folder) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        subfolders = []
+        for entry in entries:
+            rel_path = f"{rel_folder}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not _matches(rel_path, entry.name, exclude) and os.path.normcase(os.path.abspath(entry.path)) not in skip:
+                    subfolders.append((entry.path, rel_path + "/"))
+            elif entry.name.lower().endswith(extensions) and entry.is_file():
+                if include and not _matches(rel_path, entry.name, include):
+                    continue
+                if not _matches(rel_path, entry.name, exclude):
+                    yield entry.path
+        # Reversed so subfolders are visited in name order
+        stack.extend(reversed(subfolders))
+
+def mirror_folder(image_path, input_root, output_root):
+    # The output folder for image_path that mirrors its place under input_root
+    rel_folder = os.path.relpath(os.path.dirname(os.path.abspath(image_path)), os.path.abspath(input_root))
+    return output_root if rel_folder == os.curdir else os.path.join(output_root, rel_folder)
+
+_DONE = object()
+
+class PathFeed:
+    # Iterates over image paths while a background thread keeps discovering
+    # them, so `found` grows towards the final total as work proceeds and
+    # `complete` tells when it is final. Lists are used as they are.
+    def __init__(self, image_paths):
+        self.error = None
+        self._thread = None
+        if isinstance(image_paths, (list, tuple)):
+            self.found = len(image_paths)
+            self.complete = True
+            self._paths = iter(image_paths)
+            self._queue = None
+            return
+        self.found = 0
+        self.complete = False
+        self._paths = None
+        self._queue = Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._discover, args=(image_paths,), daemon=True)
+        self._thread.start()
+
+    def _discover(self, image_paths):
+        try:
+            for image_path in image_paths:
+                if self._stop.is_set():
+                    break
+                self._queue.put(image_path)
+                self.found += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.complete = True
+            self._queue.put(_DONE)
+
+    def close(self):
+        # Stops discovery early, e.g. when the batch is cancelled
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._queue is None:
+            return next(self._paths)
+        image_path = self._queue.get()
+        if image_path is _DONE:
+            # Keep later calls ending too
+            self._queue.put(_DONE)
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        return image_path
@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from PIL import Image
+import os
+
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+EXTENSION_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP"}
+SUBSAMPLING = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}
+ORIENTATION = 0x0112
+# Pillow opens many camera and phone JPEGs as MPO (JPEG plus extra frames)
+JPEG_SOURCE_FORMATS = ("JPEG", "MPO")
+
+# Modes each output format can store; others are converted before saving
+SAVE_MODES = {
+    "JPEG": ("RGB", "L", "CMYK"),
+    "PNG": ("1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"),
+    "WEBP": ("RGB", "RGBA"),
+    "BMP": ("1", "L", "P", "RGB", "RGBA"),
+}
+
+# Profile defaults; explicit preset fields win over these
+PROFILES = {
+    "": {},
+    "fast": {"progressive": False, "optimize": False, "subsampling": "4:2:0", "compress_level": 1, "method": 0},
+    "small": {"progressive": True, "optimize": True, "compress_level": 9, "method": 6},
+}
+
+def default_output_options():
+    return {
+        "format": "",
+        "profile": "",
+        "quality": "",
+        "subsampling": "",
+        "progressive": "",
+        "optimize": "",
+        "compress_level": "",
+        "keep_metadata": True,
+    }
+
+def _int_or_none(value):
+    return int(value) if value not in ("", None) else None
+
+def _bool_or_none(value):
+    return bool(value) if value not in ("", None) else None
+
+def _color_space(mode):
+    # What an ICC profile for an image of this mode describes
+    if mode == "CMYK":
+        return "CMYK"
+    if mode in ("1", "L", "LA", "I", "I;16", "F"):
+        return "GRAY"
+    return "RGB"
+
+@dataclass(frozen=True)
+class EncoderSettings:
+    # Output encoding for a preset, from its "output" options. Empty fields
+    # fall back to the profile and then to Pillow's defaults (an explicit
+    # False for progressive or optimize wins over the profile);
+    # an empty format keeps the input's format as before. A JPEG quality of
+    # "keep" reuses a JPEG source's quantization tables and sampling.
+    format: str = ""
+    profile: str = ""
+    quality: int = None
+    subsampling: str = ""
+    progressive: bool = None
+    optimize: bool = None
+    compress_level: int = None
+    keep_metadata: bool = True
+
+    @classmethod
+    def from_preset(cls, preset):
+        options = dict(default_output_options(), **preset.get("output", {}))
+        fmt = options["format"].upper()
+        if fmt == "JPG":
+            fmt = "JPEG"
+        if fmt and fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"unsupported output format {options['format']!r}")
+        if options["profile"] not in PROFILES:
+            raise ValueError(f"unknown output profile {options['profile']!r}")
+        if options["subsampling"] and options["subsampling"] not in SUBSAMPLING and options["subsampling"] != "keep":
+            raise ValueError(f"unknown subsampling {options['subsampling']!r}")
+        return cls(
+            format=fmt,
+            profile=options["profile"],
+            quality=options["quality"] if options["quality"] == "keep" else _int_or_none(options["quality"]),
+            subsampling=options["subsampling"],
+            progressive=_bool_or_none(options["progressive"]),
+            optimize=_bool_or_none(options["optimize"]),
+            compress_level=_int_or_none(options["compress_level"]),
+            keep_metadata=bool(options["keep_metadata"]),
+        )
+
+    def output_format(self, image_path):
+        ext = os.path.splitext(image_path)[1].lower()
+        return self.format or EXTENSION_FORMATS.get(ext) or Image.registered_extensions().get(ext)
+
+    def output_extension(self, image_path):
+        # Keep the input's own extension (and its case) unless converting
+        return FORMAT_EXTENSIONS[self.format] if self.format else os.path.splitext(image_path)[1]
+
+    def _option(self, name):
+        value = getattr(self, name)
+        if value is None or value == "":
+            return PROFILES[self.profile].get(name, value)
+        return value
+
+    def prepare(self, img, fmt):
+        # Converts img to a mode fmt can store: RGBA where the format has
+        # alpha and img has transparency, RGB otherwise (JPEG flattens alpha)
+        modes = SAVE_MODES.get(fmt)
+        if modes is None or img.mode in modes:
+            return img
+        if "RGBA" in modes and ("A" in img.mode or "transparency" in img.info):
+            return img.convert("RGBA")
+        return img.convert("RGB")
+
+    def save_kwargs(self, fmt, source, mode=None):
+        # Keyword arguments for Image.save. source is the decoded input, whose
+        # EXIF and ICC blocks are carried over; mode is that of the image being
+        # saved, and the ICC profile is left out if it describes another color
+        # space (e.g. a CMYK source written as RGB).
+        kwargs = {}
+        if fmt == "JPEG":
+            if self.quality == "keep":
+                kwargs.update(source_tables(source))
+            elif self.quality is not None:
+                kwargs["quality"] = self.quality
+            subsampling = self._option("subsampling")
+            if subsampling == "keep" or (self.quality == "keep" and not subsampling):
+                if source.format in JPEG_SOURCE_FORMATS:
+                    from PIL import JpegImagePlugin
+                    sampling = JpegImagePlugin.get_sampling(source)
+                    if sampling != -1:
+                        kwargs["subsampling"] = sampling
+            elif subsampling:
+                kwargs["subsampling"] = SUBSAMPLING[subsampling]
+            kwargs["progressive"] = bool(self._option("progressive"))
+            kwargs["optimize"] = bool(self._option("optimize"))
+        elif fmt == "PNG":
+            compress_level = self._option("compress_level")
+            if compress_level is not None:
+                kwargs["compress_level"] = compress_level
+            kwargs["optimize"] = bool(self._option("optimize"))
+        elif fmt == "WEBP":
+            if self.quality not in (None, "keep"):
+                kwargs["quality"] = self.quality
+            kwargs["method"] = PROFILES[self.profile].get("method", 4)
+        if self.keep_metadata:
+            kwargs.update(source_metadata(source))
+            if mode is not None and _color_space(mode) != _color_space(source.mode):
+                kwargs.pop("icc_profile", None)
+        return kwargs
+
+    def keeps_source_quality(self, fmt, source):
+        # Whether a JPEG output can reuse source's tables: nothing asks for a
+        # particular quality or sampling and the source is a JPEG whose
+        # tables Pillow can write back
+        return fmt == "JPEG" and self.quality is None and not self._option("subsampling") and bool(source_tables(source))
+
+def source_tables(source):
+    # The quantization tables of a decoded JPEG as Image.save's qtables, or
+    # nothing if source isn't a JPEG (or has tables JPEG files can't carry)
+    if source.format not in JPEG_SOURCE_FORMATS:
+        return {}
+    tables = getattr(source, "quantization", None)
+    if not tables or len(tables) > 4 or any(len(table) != 64 for table in tables.values()):
+        return {}
+    return {"qtables": tables}
+
+def source_metadata(source):
+    # EXIF and ICC from the decoded input, copied as raw bytes. The border is
+    # added to the stored (unrotated) pixels, so an EXIF orientation other than
+    # "normal" is reset; otherwise viewers would rotate the border off the bottom.
+    metadata = {}
+    if source.info.get("icc_profile"):
+        metadata["icc_profile"] = source.info["icc_profile"]
+    if source.info.get("exif"):
+        exif = source.getexif()
+        if exif.get(ORIENTATION, 1) != 1:
+            exif[ORIENTATION] = 1
+            metadata["exif"] = exif.tobytes()
+        else:
+            metadata["exif"] = source.info["exif"]
+    return metadata
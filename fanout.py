@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from PIL import Image
+from encoder import FORMAT_EXTENSIONS
+
+@dataclass(frozen=True)
+class Rendition:
+    # One output of a fan-out: a preset, optionally with the photo shrunk to
+    # fit max_size pixels on its long edge and a different output format
+    preset_name: str
+    max_size: int = None
+    format: str = ""
+
+    @property
+    def suffix(self):
+        # Full-size renditions keep the regular output name
+        return f"_{self.max_size}" if self.max_size else ""
+
+def parse_rendition(spec):
+    # "PRESET[:MAX_SIZE[:FORMAT]]", e.g. "Signature+LOGO:2048:WEBP"
+    preset_name, _, rest = spec.partition(":")
+    max_size, _, fmt = rest.partition(":")
+    if not preset_name:
+        raise ValueError(f"rendition {spec!r} has no preset name")
+    fmt = fmt.strip().upper()
+    fmt = "JPEG" if fmt == "JPG" else fmt
+    if fmt and fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"rendition {spec!r} has an unsupported format")
+    return Rendition(preset_name.strip(), int(max_size) if max_size.strip() else None, fmt)
+
+def parse_renditions(text):
+    # Comma-separated rendition specs, as typed into the GUI
+    return [parse_rendition(spec) for spec in text.split(",") if spec.strip()]
+
+def fit_within(img, max_size):
+    factor = max_size / max(img.size)
+    size = (max(1, round(img.width * factor)), max(1, round(img.height * factor)))
+    return img.resize(size, Image.LANCZOS)
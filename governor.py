@@ -0,0 +1,140 @@
+from PIL import Image
+from render_plan import RenderPlan
+from stream_writer import PNG_MODES
+from collections import deque
+import io
+import threading
+
+def bytes_per_pixel(mode):
+    # Pillow's in-memory layout: 8-bit single-band modes take one byte per
+    # pixel, 16-bit ones two, everything else (RGB included) four
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+def read_header(source):
+    # (size, mode) from the file header, without decoding any pixels.
+    # source is a path or the encoded bytes.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        return img.size, img.mode
+
+class JobEstimator:
+    # Estimates the peak memory one file of a batch needs in a worker: the
+    # decoded source, plus per output the resized photo, the canvas and one
+    # more canvas-sized allocation for format conversion and the encoded
+    # result. PNGs that BorderPresetManager would stream in bands only count
+    # the band budget instead of their canvas.
+    def __init__(self, presets, preset_name, logo_path, renditions=None, stream_budget=None):
+        targets = [(preset_name, None)] if not renditions else [(r.preset_name, r.max_size) for r in renditions]
+        self.outputs = [(self._plan(presets.get(name), logo_path), max_size) for name, max_size in targets]
+        self.stream_budget = stream_budget
+
+    @staticmethod
+    def _plan(preset, logo_path):
+        # A preset that doesn't compile fails in the worker, per file
+        try:
+            return RenderPlan.from_preset(preset, logo_path)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+
+    def estimate(self, image_path, data=None):
+        # Files whose header can't be read cost nothing here; the worker
+        # reports the error
+        try:
+            (width, height), mode = read_header(data if data is not None else image_path)
+        except (OSError, SyntaxError, ValueError):
+            return 0
+        bpp = bytes_per_pixel(mode)
+        peak = 0
+        for plan, max_size in self.outputs:
+            photo_width, photo_height = width, height
+            photo_bytes = 0
+            if max_size and max(width, height) > max_size:
+                factor = max_size / max(width, height)
+                photo_width, photo_height = max(1, round(width * factor)), max(1, round(height * factor))
+                photo_bytes = photo_width * photo_height * bpp
+            if plan is None:
+                peak = max(peak, photo_bytes + 2 * photo_width * photo_height * bpp)
+                continue
+            canvas_width, canvas_height = plan.canvas_size(photo_width, photo_height)
+            canvas_bytes = canvas_width * canvas_height * bpp
+            fmt = plan.encoder.output_format(image_path)
+            if self.stream_budget and fmt == "PNG" and mode in PNG_MODES and canvas_bytes > self.stream_budget:
+                output_bytes = self.stream_budget
+            else:
+                output_bytes = 2 * canvas_bytes
+            peak = max(peak, photo_bytes + output_bytes)
+        return width * height * bpp + peak
+
+class MemoryGovernor:
+    # Admits jobs while the sum of their estimated peaks fits the budget. A
+    # job larger than the whole budget is admitted once nothing else is
+    # running, so it runs alone rather than never. Without a budget every
+    # job is admitted.
+    def __init__(self, budget):
+        self.budget = budget
+        self.in_use = 0
+        self.running = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, cost):
+        return not self.budget or self.running == 0 or self.in_use + cost <= self.budget
+
+    def try_acquire(self, cost):
+        with self._condition:
+            if not self._fits(cost):
+                return False
+            self.in_use += cost
+            self.running += 1
+            return True
+
+    def acquire(self, cost):
+        with self._condition:
+            self._condition.wait_for(lambda: self._fits(cost))
+            self.in_use += cost
+            self.running += 1
+
+    def release(self, cost):
+        with self._condition:
+            self.in_use -= cost
+            self.running -= 1
+            self._condition.notify_all()
+
+class AdmissionQueue:
+    # Picks the next file to start from a short look-ahead over the incoming
+    # paths: the oldest one that fits the governor's budget. Smaller files may
+    # overtake a large one that doesn't fit yet, but only `lookahead` times
+    # in a row; after that the large one goes next, once enough has finished.
+    def __init__(self, image_paths, governor, estimate, lookahead=8):
+        self.image_paths = iter(image_paths)
+        self.governor = governor
+        self.estimate = estimate
+        self.lookahead = max(1, lookahead)
+        self.waiting = deque()
+        self.overtaken = 0
+        self._exhausted = False
+
+    def _fill(self):
+        while not self._exhausted and len(self.waiting) < self.lookahead:
+            image_path = next(self.image_paths, None)
+            if image_path is None:
+                self._exhausted = True
+            else:
+                self.waiting.append((image_path, self.estimate(image_path)))
+
+    def take(self):
+        # Returns (image_path, cost) of an admitted file, or None if nothing
+        # fits right now or no files are left. The caller releases the cost.
+        self._fill()
+        for index, (image_path, cost) in enumerate(self.waiting):
+            if index and self.overtaken >= self.lookahead:
+                break
+            if self.governor.try_acquire(cost):
+                del self.waiting[index]
+                self.overtaken = self.overtaken + 1 if index else 0
+                return image_path, cost
+        return None
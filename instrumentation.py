@@ -0,0 +1,118 @@
+from atomic_io import write_atomic
+from contextlib import contextmanager
+import json
+import os
+import time
+
+STAGES = ("read", "decode", "resize", "canvas", "strip", "logo", "text", "encode", "write")
+REPORT_NAME = "border_profile.json"
+
+class StageTimer:
+    # Wall time and bytes per pipeline stage for one file. Stages may repeat
+    # (e.g. streamed bands); their times and bytes add up.
+    enabled = True
+
+    def __init__(self, image_path):
+        self.image_path = image_path
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, nbytes)
+
+    def add(self, name, seconds=0.0, nbytes=0):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += nbytes
+
+    def record(self, error=None):
+        return {
+            "path": self.image_path,
+            "error": error,
+            "total_seconds": sum(seconds for seconds, _ in self.stages.values()),
+            "stages": {name: {"seconds": seconds, "bytes": nbytes} for name, (seconds, nbytes) in self.stages.items()},
+        }
+
+def add_stage(record, name, seconds, nbytes=0):
+    # Adds a stage measured outside the worker (e.g. pipelined reads and
+    # writes) to a record produced by StageTimer.record()
+    stage = record["stages"].setdefault(name, {"seconds": 0.0, "bytes": 0})
+    stage["seconds"] += seconds
+    stage["bytes"] += nbytes
+    record["total_seconds"] += seconds
+
+class NullTimer:
+    # Stand-in used when instrumentation is off; costs one attribute lookup
+    enabled = False
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        yield
+
+    def add(self, name, seconds=0.0, nbytes=0):
+        pass
+
+NULL_TIMER = NullTimer()
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+class Profiler:
+    # Collects per-file records from StageTimer.record(). Hooks are called
+    # with each record as it arrives (in the process running the batch).
+    def __init__(self, hooks=None, slowest=10):
+        self.hooks = list(hooks or [])
+        self.slowest = slowest
+        self.records = []
+        self.started = time.perf_counter()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def add(self, record):
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def summary(self):
+        stages = {}
+        for record in self.records:
+            for name, stage in record["stages"].items():
+                entry = stages.setdefault(name, {"seconds": [], "bytes": 0})
+                entry["seconds"].append(stage["seconds"])
+                entry["bytes"] += stage["bytes"]
+        stage_summary = {}
+        for name in sorted(stages, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES)):
+            seconds = stages[name]["seconds"]
+            stage_summary[name] = {
+                "files": len(seconds),
+                "total_seconds": round(sum(seconds), 6),
+                "bytes": stages[name]["bytes"],
+                "p50_ms": round(_percentile(seconds, 0.5) * 1000, 3),
+                "p95_ms": round(_percentile(seconds, 0.95) * 1000, 3),
+                "max_ms": round(max(seconds) * 1000, 3),
+            }
+        totals = [record["total_seconds"] for record in self.records]
+        slowest = sorted(self.records, key=lambda r: r["total_seconds"], reverse=True)[:self.slowest]
+        return {
+            "files": len(self.records),
+            "failed": sum(1 for record in self.records if record["error"]),
+            "wall_seconds": round(time.perf_counter() - self.started, 6),
+            "file_p50_ms": round(_percentile(totals, 0.5) * 1000, 3) if totals else None,
+            "file_p95_ms": round(_percentile(totals, 0.95) * 1000, 3) if totals else None,
+            "stages": stage_summary,
+            "slowest_files": [{"path": r["path"], "total_ms": round(r["total_seconds"] * 1000, 3)} for r in slowest],
+        }
+
+    def write_report(self, output_folder, include_files=True):
+        report = {"summary": self.summary()}
+        if include_files:
+            report["files"] = self.records
+        path = os.path.join(output_folder, REPORT_NAME)
+        write_atomic(path, json.dumps(report, indent=2).encode())
+        return path
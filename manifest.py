@@ -0,0 +1,106 @@
+from atomic_io import write_atomic
+from pic_border_UI import BorderPresetManager
+from render_plan import RenderPlan
+from discovery import mirror_folder
+from dataclasses import astuple
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".border_manifest.json"
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def preset_hash(preset):
+    # Hash of the preset after type normalization, so "50" and 50 agree
+    plan = RenderPlan.from_preset(preset, "")
+    normalized = [plan.border_width, plan.extra_bottom_height, list(plan.logo_size), plan.include_signature,
+                  plan.font_path, plan.modify_signature, [list(part) for part in plan.signature_parts],
+                  list(astuple(plan.encoder))]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+class BatchManifest:
+    # Records, per output file, the hashes of everything it was built from:
+    # input, normalized preset, logo and font. Files whose record still
+    # matches (and whose output exists) are skipped on later runs, so a rerun
+    # only redoes changed work and an interrupted run picks up where it stopped.
+    def __init__(self, output_folder, save_every=50):
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.save_every = save_every
+        self.skipped = 0
+        self._pending = {}
+        self._unsaved = 0
+        self._hash_cache = {}
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return data.get("entries", {})
+
+    def save(self):
+        # Write to a temp file and rename so a crash never leaves half a manifest
+        write_atomic(self.path, json.dumps({"version": 1, "entries": self.entries}).encode())
+        self._unsaved = 0
+
+    def _asset_hash(self, path):
+        # Logos and fonts are shared by the whole batch; hash each once per run
+        if path not in self._hash_cache:
+            self._hash_cache[path] = file_hash(path) if os.path.isfile(path) else None
+        return self._hash_cache[path]
+
+    def _input_hash(self, image_path, stat, entry):
+        # Trust the previous hash while size and mtime are unchanged
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return entry["input_hash"]
+        return file_hash(image_path)
+
+    @staticmethod
+    def _same_content(entry, record):
+        return all(entry.get(name) == record[name] for name in record if name not in ("size", "mtime"))
+
+    def pending(self, preset_name, preset, image_paths, logo_path, input_root=None):
+        # Yields the image paths that need (re)processing, hashing lazily so
+        # a streamed scan can feed it. With input_root, outputs are expected
+        # in the mirrored subfolders of the output folder.
+        output_folder = os.path.dirname(self.path)
+        plan = RenderPlan.from_preset(preset, logo_path)
+        shared = {
+            "preset_hash": preset_hash(preset),
+            "logo_hash": self._asset_hash(logo_path) if plan.logo_size != (0, 0) else None,
+            "font_hash": self._asset_hash(plan.font_path) if plan.include_signature else None,
+        }
+        self.skipped = 0
+        for image_path in image_paths:
+            target_folder = mirror_folder(image_path, input_root, output_folder) if input_root else output_folder
+            output_path = BorderPresetManager.output_path(preset_name, image_path, target_folder, plan.encoder.output_extension(image_path))
+            key = os.path.relpath(output_path, output_folder)
+            entry = self.entries.get(key)
+            stat = os.stat(image_path)
+            record = dict(shared, input_path=os.path.abspath(image_path), size=stat.st_size, mtime=stat.st_mtime,
+                          input_hash=self._input_hash(image_path, stat, entry))
+            if entry is not None and self._same_content(entry, record) and os.path.exists(output_path):
+                # Content unchanged; only refresh the stat shortcut if it moved
+                if entry != record:
+                    self.entries[key] = record
+                    self._unsaved += 1
+                self.skipped += 1
+                continue
+            self._pending[image_path] = (key, record)
+            yield image_path
+
+    def record(self, image_path):
+        # Called once the output for image_path has been written
+        key, record = self._pending.pop(image_path)
+        self.entries[key] = record
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
@@ -1,168 +1,313 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
+from collections import OrderedDict
+from atomic_io import atomic_output, write_atomic
+from backends import get_backend
+from dataclasses import replace
+from fanout import fit_within
+from instrumentation import NULL_TIMER
+from preset_store import PresetStore, content_hash, normalize_preset
+from render_plan import RenderPlan, scale_preset
+from stream_writer import PNG_MODES, write_png_bands
+import io
 import os
+import threading
 import json
 
-class BorderPresetManager:
-    def __init__(self):
-        self.presets = self.load_presets()
-
-    def load_presets(self):
-        try:
-            with open('presets.json', 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {
-                "Signature+LOGO": {
-                    "border_width": "50",
-                    "extra_bottom_height": "200",
-                    "font_size": "72",
-                    "signature_text": "Enter Your Name Here",
-                    "font_path": "c:\\WINDOWS\\Fonts\\GREATVIBES-REGULAR.TTF",
-                    "include_signature": True,
-                    "logo_size": [
-                        345,
-                        150
-                    ],
-                    "signature_options": {
-                        "first_half_text": "",
-                        "first_half_font_size": "",
-                        "second_half_text": "",
-                        "second_half_font_size": "",
-                        "first_half_color": "blue",
-                        "second_half_color": "white",
-                        "modify_signature": False
-                    }
-                },
-                "LOGO": {
-                    "border_width": "50",
-                    "extra_bottom_height": "200",
-                    "font_size": "72",
-                    "signature_text": "",
-                    "font_path": "c:\\WINDOWS\\Fonts\\GREATVIBES-REGULAR.TTF",
-                    "include_signature": False,
-                    "logo_size": [
-                        345,
-                        150
-                    ],
-                    "signature_options": {
-                        "first_half_text": "",
-                        "first_half_font_size": "",
-                        "second_half_text": "",
-                        "second_half_font_size": "",
-                        "first_half_color": "",
-                        "second_half_color": "",
-                        "modify_signature": False
-                    }
-                },
-                "Signature": {
-                    "border_width": "50",
-                    "extra_bottom_height": "150",
-                    "font_size": "72",
-                    "signature_text": "",
-                    "font_path": "c:\\WINDOWS\\Fonts\\BowlbyOneSC-Regular.ttf",
-                    "include_signature": True,
-                    "logo_size": [
-                        0,
-                        0
-                    ],
-                    "signature_options": {
-                        "first_half_text": "Enter",
-                        "first_half_font_size": "60",
-                        "second_half_text": "Here",
-                        "second_half_font_size": "72",
-                        "first_half_color": "#cdf9ff",
-                        "second_half_color": "#459dcc",
-                        "modify_signature": True
-                    }
-                }
+def default_presets():
+    return {
+        "Signature+LOGO": {
+            "border_width": "50",
+            "extra_bottom_height": "200",
+            "font_size": "72",
+            "signature_text": "Enter Your Name Here",
+            "font_path": "c:\\WINDOWS\\Fonts\\GREATVIBES-REGULAR.TTF",
+            "include_signature": True,
+            "logo_size": [
+                345,
+                150
+            ],
+            "signature_options": {
+                "first_half_text": "",
+                "first_half_font_size": "",
+                "second_half_text": "",
+                "second_half_font_size": "",
+                "first_half_color": "blue",
+                "second_half_color": "white",
+                "modify_signature": False
+            }
+        },
+        "LOGO": {
+            "border_width": "50",
+            "extra_bottom_height": "200",
+            "font_size": "72",
+            "signature_text": "",
+            "font_path": "c:\\WINDOWS\\Fonts\\GREATVIBES-REGULAR.TTF",
+            "include_signature": False,
+            "logo_size": [
+                345,
+                150
+            ],
+            "signature_options": {
+                "first_half_text": "",
+                "first_half_font_size": "",
+                "second_half_text": "",
+                "second_half_font_size": "",
+                "first_half_color": "",
+                "second_half_color": "",
+                "modify_signature": False
             }
+        },
+        "Signature": {
+            "border_width": "50",
+            "extra_bottom_height": "150",
+            "font_size": "72",
+            "signature_text": "",
+            "font_path": "c:\\WINDOWS\\Fonts\\BowlbyOneSC-Regular.ttf",
+            "include_signature": True,
+            "logo_size": [
+                0,
+                0
+            ],
+            "signature_options": {
+                "first_half_text": "Enter",
+                "first_half_font_size": "60",
+                "second_half_text": "Here",
+                "second_half_font_size": "72",
+                "first_half_color": "#cdf9ff",
+                "second_half_color": "#459dcc",
+                "modify_signature": True
+            }
+        }
+    }
+
+class BorderPresetManager:
+    def __init__(self, presets=None, memory_budget=None, backend=None, max_plans=16):
+        # Without explicit presets, they come from presets.json (or a presets
+        # folder) through a PresetStore, see preset_store.py
+        self.store = None
+        self.presets = presets if presets is not None else self.load_presets()
+        # Bytes an output canvas may take before PNG outputs are written in bands
+        self.memory_budget = memory_budget
+        # Compositing engine by name, see backends.py (Pillow by default)
+        self.backend = get_backend(backend)
+        # Compiled plans, least recently used first. Renditions compile one
+        # per photo scale, so only the last max_plans are kept.
+        self.max_plans = max_plans
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+
+    def load_presets(self, path='presets.json'):
+        self.store = PresetStore(path, default_presets())
+        return self.store.presets
+
+    def set_preset(self, preset_name, preset):
+        # Validates and normalizes preset (ValueError if invalid); the store
+        # writes it shortly afterwards
+        if self.store is not None:
+            self.store.set(preset_name, preset)
+        else:
+            self.presets[preset_name] = normalize_preset(preset)
 
     def save_presets(self):
-        with open('presets.json', 'w') as f:
-            json.dump(self.presets, f, indent=4)
+        # Writes pending changes now
+        if self.store is not None:
+            self.store.flush()
+        else:
+            write_atomic('presets.json', json.dumps(self.presets, indent=4).encode())
 
-    def apply_preset(self, preset_name, image_path, logo_path, output_folder, delete_input=False):
+    def compile_preset(self, preset_name, logo_path, scale=1.0):
+        # Plans are reused until the preset contents (compared by hash) or the
+        # logo file change. scale != 1 gives a plan for a resized photo, with
+        # border, font and logo sizes scaled to match.
+        # The store keeps each preset's hash; read it before the preset, which
+        # the store replaces first, so a racing update only costs a recompile
+        digest = self.store.hashes.get(preset_name) if self.store is not None else None
         preset = self.presets[preset_name]
-        # Open the main image
-        main_img = Image.open(image_path)
-
-        # Extract preset parameters and ensure they are integers
-        border_width = int(preset["border_width"])
-        extra_bottom_height = int(preset["extra_bottom_height"])
-        logo_size = tuple(map(int, preset["logo_size"]))
-        font_size = int(preset["font_size"])
-        signature_text = preset["signature_text"]
-        font_path = preset["font_path"]
-        include_signature = preset["include_signature"]
-
-        # Create new image with white background and asymmetric border
-        new_width = main_img.width + (border_width * 2)
-        new_height = main_img.height + border_width + (border_width + extra_bottom_height)
-        bordered_img = Image.new(main_img.mode, (new_width, new_height), 'white')
-
-        # Paste main image onto white background
-        bordered_img.paste(main_img, (border_width, border_width))
-
-        # Update main_img and dimensions for logo/signature placement
-        main_img = bordered_img
-        main_width, main_height = main_img.size
-
-        # Open the logo if logo size is not zero
-        if logo_size != (0, 0):
-            logo = Image.open(logo_path)
-            logo = logo.resize(logo_size)
-            # Calculate logo position (left side in bottom border area for preset1, center for preset2)
-            if include_signature:
-                logo_position = (border_width + 20, main_height - extra_bottom_height)
-            else:
-                logo_position = ((main_width - logo.width) // 2, main_height - extra_bottom_height)
-
-            # Handle logo transparency
-            if logo.mode == 'RGBA':
-                logo_rgba = logo.convert('RGBA')
-                mask = logo_rgba.split()[3]  # Get alpha channel
-                main_img.paste(logo, logo_position, mask)
-            else:
-                main_img.paste(logo, logo_position)
-
-        if include_signature:
-            # Draw a customizable signature
-            draw = ImageDraw.Draw(main_img)
-            signature_options = preset.get("signature_options", {})
-            modify_signature = signature_options.get("modify_signature", True)
-            if modify_signature:
-                first_half_text = signature_options.get("first_half_text", "")
-                first_half_color = signature_options.get("first_half_color", "black")
-                first_half_font_size = int(signature_options.get("first_half_font_size", font_size))
-                second_half_text = signature_options.get("second_half_text", "")
-                second_half_color = signature_options.get("second_half_color", "black")
-                second_half_font_size = int(signature_options.get("second_half_font_size", font_size))
-
-                # Load fonts
-                first_half_font = ImageFont.truetype(font_path, first_half_font_size)
-                second_half_font = ImageFont.truetype(font_path, second_half_font_size)
-
-                # Calculate positions
-                first_half_bbox = draw.textbbox((0, 0), first_half_text, font=first_half_font)
-                second_half_bbox = draw.textbbox((0, 0), second_half_text, font=second_half_font)
-                total_width = (first_half_bbox[2] - first_half_bbox[0]) + (second_half_bbox[2] - second_half_bbox[0])
-                max_height = max(first_half_bbox[3], second_half_bbox[3])
-                first_half_position = ((main_width - total_width) // 2, main_height - extra_bottom_height - border_width // 2 + (extra_bottom_height - max_height) // 2 + (max_height - first_half_bbox[3]))
-                second_half_position = (first_half_position[0] + (first_half_bbox[2] - first_half_bbox[0]), main_height - extra_bottom_height - border_width // 2 + (extra_bottom_height - max_height) // 2 + (max_height - second_half_bbox[3]))
-
-                # Draw texts
-                draw.text(first_half_position, first_half_text, fill=first_half_color, font=first_half_font)
-                draw.text(second_half_position, second_half_text, fill=second_half_color, font=second_half_font)
-            else:
-                # Draw the signature text without modification
-                font = ImageFont.truetype(font_path, font_size)
-                bbox = draw.textbbox((0, 0), signature_text, font=font)
-                text_width = bbox[2] - bbox[0]
-                signature_position = ((main_width - text_width) // 2, main_height - extra_bottom_height + (extra_bottom_height - bbox[3]) // 2)
-                draw.text(signature_position, signature_text, fill="black", font=font)
-
-        # Save the result in the specified output folder
+        if digest is None:
+            digest = content_hash(preset)
+        logo_mtime = os.path.getmtime(logo_path) if tuple(map(int, preset["logo_size"])) != (0, 0) else None
+        scale = round(scale, 4)
+        key = (preset_name, logo_path, scale)
+        with self._plans_lock:
+            cached = self._plans.get(key)
+            if cached is not None and cached[0] == digest and cached[1] == logo_mtime:
+                self._plans.move_to_end(key)
+                return cached[2]
+        plan = RenderPlan.from_preset(preset if scale == 1 else scale_preset(preset, scale), logo_path)
+        with self._plans_lock:
+            self._plans[key] = (digest, logo_mtime, plan)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return plan
+
+    @staticmethod
+    def output_name(preset_name, image_path, extension=None, suffix=""):
+        # extension overrides the input's own when the preset converts formats
         base_name = os.path.basename(image_path)
-        output_path = os.path.join(output_folder, f"{os.path.splitext(base_name)[0]}_preset_{preset_name}{os.path.splitext(base_name)[1]}")
-        main_img.save(output_path)
+        extension = os.path.splitext(base_name)[1] if extension is None else extension
+        return f"{os.path.splitext(base_name)[0]}_preset_{preset_name}{suffix}{extension}"
+
+    @staticmethod
+    def output_path(preset_name, image_path, output_folder, extension=None, suffix=""):
+        return os.path.join(output_folder, BorderPresetManager.output_name(preset_name, image_path, extension, suffix))
+
+    def apply_preset(self, preset_name, image_path, logo_path, output_folder, delete_input=False, timer=NULL_TIMER):
+        # timer is an instrumentation.StageTimer when per-stage timings are wanted
+        self._apply(preset_name, None, image_path, logo_path, output_folder, delete_input, timer)
+
+    def apply_renditions(self, renditions, image_path, logo_path, output_folder, delete_input=False, timer=NULL_TIMER):
+        # Decodes image_path once and writes one output per fanout.Rendition.
+        # Returns the output paths.
+        return self._apply(None, renditions, image_path, logo_path, output_folder, delete_input, timer)
+
+    def render_outputs(self, preset_name, data, image_path, logo_path, renditions=None, timer=NULL_TIMER):
+        # In-memory variant for callers doing their own I/O: data is the
+        # encoded input, image_path only names the outputs. Returns a list of
+        # (output file name, encoded bytes).
+        main_img = self._open_source(data, timer)
+        return [(name, self._encode(plan, encoder, fmt, photo, main_img, timer))
+                for plan, encoder, fmt, photo, name in self._targets(preset_name, renditions, image_path, main_img, logo_path, timer)]
+
+    def render_image(self, preset_name, source, logo_path, fmt=None, timer=NULL_TIMER):
+        # In-memory API: source is encoded bytes, a binary file object or a
+        # PIL Image; returns the encoded result. fmt overrides the preset's
+        # output format, which otherwise follows the source (PNG if unknown).
+        return self.render_encoded(preset_name, source, logo_path, fmt, timer)[1]
+
+    def render_encoded(self, preset_name, source, logo_path, fmt=None, timer=NULL_TIMER):
+        # render_image, returning (output format, encoded bytes)
+        main_img = self._open_source(source, timer)
+        plan = self.compile_preset(preset_name, logo_path)
+        out_fmt = self._render_format(plan, main_img, fmt)
+        return out_fmt, self._encode(plan, plan.encoder, out_fmt, main_img, main_img, timer)
+
+    def render_batch(self, preset_name, sources, logo_path, fmt=None, timer=NULL_TIMER):
+        # render_image for several inputs at once; backends that can (NumPy)
+        # composite same-size inputs together. Returns the encoded results in
+        # the order of sources.
+        images = [self._open_source(source, timer) for source in sources]
+        plan = self.compile_preset(preset_name, logo_path)
+        results = []
+        for main_img, bordered_img in zip(images, self.backend.render_batch(plan, images, timer)):
+            out_fmt = self._render_format(plan, main_img, fmt)
+            encoder = self._output_encoder(plan, plan.encoder, out_fmt, main_img, main_img)
+            bordered_img = encoder.prepare(bordered_img, out_fmt)
+            buffer = io.BytesIO()
+            with timer.stage("encode"):
+                self.backend.encode(bordered_img, buffer, out_fmt, **encoder.save_kwargs(out_fmt, main_img, bordered_img.mode))
+            results.append(buffer.getvalue())
+        return results
+
+    @staticmethod
+    def _render_format(plan, main_img, fmt):
+        fmt = (fmt or plan.encoder.format or main_img.format or "PNG").upper()
+        # MPO sources are written as plain JPEGs
+        return "JPEG" if fmt in ("JPG", "MPO") else fmt
+
+    def _apply(self, preset_name, renditions, image_path, logo_path, output_folder, delete_input, timer):
+        # Open the main image
+        main_img = self._decode(image_path, timer)
+
+        # Save the results in the specified output folder
+        output_paths = []
+        for plan, encoder, fmt, photo, name in self._targets(preset_name, renditions, image_path, main_img, logo_path, timer):
+            output_path = os.path.join(output_folder, name)
+            self._write(plan, encoder, fmt, photo, main_img, output_path, delete_input, timer)
+            output_paths.append(output_path)
+        # Every output is in place by now, so the input can go
         os.remove(image_path) if delete_input else None
+        return output_paths
+
+    def _targets(self, preset_name, renditions, image_path, main_img, logo_path, timer):
+        # Yields (plan, encoder, format, photo, output name) for each output.
+        # Renditions are made largest first, each resize starting from the
+        # previous (larger) photo rather than the original.
+        if not renditions:
+            plan = self.compile_preset(preset_name, logo_path)
+            encoder = plan.encoder
+            yield plan, encoder, encoder.output_format(image_path), main_img, self.output_name(preset_name, image_path, encoder.output_extension(image_path))
+            return
+        photo = main_img
+        for rendition in sorted(renditions, key=lambda r: r.max_size or float("inf"), reverse=True):
+            if rendition.max_size and max(photo.size) > rendition.max_size:
+                with timer.stage("resize"):
+                    photo = fit_within(photo, rendition.max_size)
+            plan = self.compile_preset(rendition.preset_name, logo_path, photo.width / main_img.width)
+            encoder = plan.encoder if not rendition.format else replace(plan.encoder, format=rendition.format)
+            name = self.output_name(rendition.preset_name, image_path, encoder.output_extension(image_path), rendition.suffix)
+            yield plan, encoder, encoder.output_format(image_path), photo, name
+
+    def _open_source(self, source, timer):
+        if isinstance(source, Image.Image):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        with timer.stage("decode", source.getbuffer().nbytes if timer.enabled and isinstance(source, io.BytesIO) else 0):
+            main_img = Image.open(source)
+            main_img.load()
+        return main_img
+
+    def _decode(self, image_path, timer):
+        with timer.stage("decode", os.path.getsize(image_path) if timer.enabled else 0):
+            main_img = Image.open(image_path)
+            main_img.load()
+        return main_img
+
+    @staticmethod
+    def _output_encoder(plan, encoder, fmt, photo, source):
+        # Border-only JPEG-to-JPEG outputs at full size are re-encoded with
+        # the source's quantization tables and sampling rather than Pillow's
+        # default quality 75: the photo keeps its quality (and file size)
+        # instead of degrading on every run. Anything else, or a preset that
+        # sets a quality or sampling of its own, takes the normal path.
+        if not plan.has_overlay and photo is source and encoder.keeps_source_quality(fmt, source):
+            return replace(encoder, quality="keep")
+        return encoder
+
+    def _encode(self, plan, encoder, fmt, photo, source, timer):
+        encoder = self._output_encoder(plan, encoder, fmt, photo, source)
+        bordered_img = encoder.prepare(plan.render(photo, timer, self.backend), fmt)
+        buffer = io.BytesIO()
+        with timer.stage("encode"):
+            self.backend.encode(bordered_img, buffer, fmt, **encoder.save_kwargs(fmt, source, bordered_img.mode))
+        return buffer.getvalue()
+
+    def _write(self, plan, encoder, fmt, photo, source, output_path, sync, timer):
+        # photo is what goes inside the border; source is the decoded input,
+        # which supplies EXIF/ICC metadata. Outputs are written to a temp file
+        # and renamed into place; sync also flushes them to disk first.
+        if self._save_streamed(plan, encoder, fmt, photo, source, output_path, sync, timer):
+            return
+        if timer.enabled:
+            # Encode to memory first so encode and disk write are timed separately
+            data = self._encode(plan, encoder, fmt, photo, source, timer)
+            with timer.stage("write", len(data)):
+                write_atomic(output_path, data, sync)
+        else:
+            encoder = self._output_encoder(plan, encoder, fmt, photo, source)
+            bordered_img = encoder.prepare(plan.render(photo, timer, self.backend), fmt)
+            with atomic_output(output_path, sync) as f:
+                self.backend.encode(bordered_img, f, fmt, **encoder.save_kwargs(fmt, source, bordered_img.mode))
+
+    def _save_streamed(self, plan, encoder, fmt, photo, source, output_path, sync=False, timer=NULL_TIMER):
+        # Large PNG outputs are built and encoded band by band so only the
+        # decoded source and one band are held in memory at once
+        if not self.memory_budget or photo.mode not in PNG_MODES or fmt != "PNG":
+            return False
+        new_width, new_height = plan.canvas_size(photo.width, photo.height)
+        row_bytes = new_width * PNG_MODES[photo.mode][1]
+        if row_bytes * new_height <= self.memory_budget:
+            return False
+        # A band is held roughly three times over: pixels, raw bytes and filtered rows
+        bands = plan.render_bands(photo, self.memory_budget // (row_bytes * 3))
+        if bands is None:
+            return False
+        # Compositing, encoding and writing are interleaved, so they are timed as one stage
+        with timer.stage("encode"):
+            save_kwargs = encoder.save_kwargs(fmt, source, photo.mode)
+            with atomic_output(output_path, sync) as f:
+                write_png_bands(f, photo.mode, (new_width, new_height), bands, save_kwargs.get("compress_level", 6),
+                                save_kwargs.get("icc_profile"), save_kwargs.get("exif"))
+        timer.add("write", 0, os.path.getsize(output_path) if timer.enabled else 0)
+        return True
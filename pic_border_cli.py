@@ -0,0 +1,139 @@
+from discovery import IMAGE_EXTENSIONS, scan_images
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pic_border_cli", description="Add preset borders, logos and signatures to images without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="image files, folders or glob patterns")
+    parser.add_argument("-p", "--preset", default="", help="preset name")
+    parser.add_argument("-r", "--rendition", action="append", default=[], metavar="PRESET[:MAX_SIZE[:FORMAT]]",
+                        help="write this rendition too, decoding each input once; may be repeated")
+    parser.add_argument("-o", "--output", required=True, help="output folder")
+    parser.add_argument("-l", "--logo", default="", help="logo image (required when the preset has a logo)")
+    parser.add_argument("-R", "--recursive", action="store_true", help="scan the input folder's subfolders too, mirroring them under the output folder")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB", help="only take images whose name (or relative path, with a slash) matches this pattern; may be repeated")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="skip images and subfolders matching this pattern; may be repeated")
+    parser.add_argument("--presets", default="presets.json", help="presets file (default: presets.json)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes, 0 for one per CPU (default: 1)")
+    parser.add_argument("--io-threads", type=int, default=0, help="threads reading and writing files alongside the workers, for slow or network storage (default: 0, off)")
+    parser.add_argument("--ram-budget", type=int, default=None, help="bytes of estimated peak memory the running workers may use together; large images then run with fewer workers")
+    parser.add_argument("--memory-budget", type=int, default=None, help="bytes per output canvas before PNGs are streamed in bands")
+    parser.add_argument("--backend", choices=("pillow", "numpy"), default="pillow", help="compositing engine; numpy gives the same output, see benchmark.py for how it compares on your images (default: pillow)")
+    parser.add_argument("--manifest", action="store_true", help="skip files whose output is up to date, using a manifest in the output folder")
+    parser.add_argument("--profile", action="store_true", help="record per-stage timings and write border_profile.json to the output folder")
+    parser.add_argument("--delete-input", action="store_true", help="delete input files after processing")
+    args = parser.parse_args(argv)
+    if not args.preset and not args.rendition:
+        parser.error("give a preset (-p) or at least one rendition (-r)")
+    if args.manifest and args.rendition:
+        parser.error("--manifest can't be combined with --rendition")
+    if args.recursive and (len(args.inputs) != 1 or not os.path.isdir(args.inputs[0])):
+        parser.error("--recursive takes a single input folder")
+    return args
+
+def expand_inputs(inputs, include=None, exclude=None):
+    # Folders contribute their images, patterns are globbed, duplicates dropped
+    seen = set()
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = scan_images(item, recursive=False, include=include, exclude=exclude)
+        elif glob.has_magic(item):
+            matches = sorted(f for f in glob.glob(item, recursive=True) if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            matches = [item]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+def load_presets(presets_file):
+    # Validated and normalized, see preset_store.py. Falls back to the
+    # built-in presets, like the GUI does; invalid presets are skipped.
+    from pic_border_UI import default_presets
+    from preset_store import PresetStore
+    try:
+        store = PresetStore(presets_file, default_presets(), delay=None)
+    except ValueError as e:
+        raise SystemExit(f"error: {e}")
+    for name, error in store.errors.items():
+        print(f"warning: skipping preset {name!r}: {error}", file=sys.stderr)
+    return store.presets
+
+class CountingPaths:
+    # Passes a streamed scan through, counting the paths taken from it
+    def __init__(self, paths):
+        self.paths = paths
+        self.count = 0
+
+    def __iter__(self):
+        for path in self.paths:
+            self.count += 1
+            yield path
+
+def run(args):
+    presets = load_presets(args.presets)
+    from backends import get_backend
+    try:
+        # Fails early, not in every worker, when NumPy is missing
+        get_backend(args.backend)
+    except ValueError as e:
+        raise SystemExit(f"error: {e}")
+    renditions = []
+    if args.rendition:
+        from fanout import Rendition, parse_rendition
+        renditions = [parse_rendition(spec) for spec in args.rendition]
+        if args.preset:
+            renditions.insert(0, Rendition(args.preset))
+    for preset_name in [args.preset] if not renditions else [r.preset_name for r in renditions]:
+        if preset_name not in presets:
+            raise SystemExit(f"error: unknown preset {preset_name!r} (available: {', '.join(presets)})")
+    os.makedirs(args.output, exist_ok=True)
+    input_root = None
+    if args.recursive:
+        # Streamed, so processing starts while the tree is still being listed
+        input_root = args.inputs[0]
+        image_paths = CountingPaths(scan_images(input_root, include=args.include, exclude=args.exclude, skip=[args.output]))
+    else:
+        image_paths = expand_inputs(args.inputs, args.include, args.exclude)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    manifest = None
+    if args.manifest:
+        from manifest import BatchManifest
+        manifest = BatchManifest(args.output)
+    from batch_engine import BatchEngine
+    engine = BatchEngine(presets, jobs, args.memory_budget, args.io_threads, ram_budget=args.ram_budget, backend=args.backend)
+    profiler = None
+    if args.profile:
+        from instrumentation import Profiler
+        profiler = Profiler()
+    errors = engine.run(args.preset, image_paths, args.logo, args.output, args.delete_input, manifest=manifest, profiler=profiler,
+                        renditions=renditions, input_root=input_root)
+    skipped = manifest.skipped if manifest is not None else 0
+    return image_paths.count if args.recursive else len(image_paths), errors, skipped
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    total, errors, skipped = run(args)
+    report = {
+        "preset": args.preset,
+        "output_folder": args.output,
+        "total": total,
+        "skipped": skipped,
+        "succeeded": total - skipped - len(errors),
+        "failed": [{"path": path, "error": error} for path, error in errors],
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,115 @@
 from PyQt6 import QtWidgets, QtGui, QtCore
+from atomic_io import write_atomic
 from pic_border_UI import BorderPresetManager
+from batch_engine import BatchEngine, default_worker_count
+from discovery import scan_images
+from encoder import default_output_options
+from fanout import parse_renditions
+from instrumentation import Profiler
+from manifest import BatchManifest
+from preview import render_preview
+from thumbnail_cache import ThumbnailCache
 import sys
 import json
 import os
+import time
+
+class BatchThread(QtCore.QThread):
+    progress = QtCore.pyqtSignal(int, int)
+    finished_batch = QtCore.pyqtSignal(list, bool)
+
+    def __init__(self, engine, preset_name, image_paths, logo_path, output_folder, delete_input, manifest=None, profiler=None, renditions=None,
+                 input_root=None):
+        super().__init__()
+        self.engine = engine
+        self.preset_name = preset_name
+        self.image_paths = image_paths
+        self.logo_path = logo_path
+        self.output_folder = output_folder
+        self.delete_input = delete_input
+        self.manifest = manifest
+        self.profiler = profiler
+        self.renditions = renditions
+        self.input_root = input_root
+
+    def run(self):
+        try:
+            errors = self.engine.run(self.preset_name, self.image_paths, self.logo_path, self.output_folder,
+                                     self.delete_input, progress_callback=self.progress.emit, manifest=self.manifest,
+                                     profiler=self.profiler, renditions=self.renditions, input_root=self.input_root)
+        except OSError as e:
+            # The folder scan itself failed
+            errors = [(e.filename or "", f"{type(e).__name__}: {e}")]
+        except Exception as e:
+            # Anything else must still reach the GUI, which waits for finished_batch
+            errors = [("", f"{type(e).__name__}: {e}")]
+        self.finished_batch.emit(errors, self.engine.cancelled)
+
+# Output option widgets and the "output" preset keys they edit
+OUTPUT_FIELDS = {
+    "output_format": "format",
+    "output_profile": "profile",
+    "quality": "quality",
+    "subsampling": "subsampling",
+    "progressive": "progressive",
+    "optimize": "optimize",
+    "compress_level": "compress_level",
+    "keep_metadata": "keep_metadata",
+}
+
+class PreviewSignals(QtCore.QObject):
+    rendered = QtCore.pyqtSignal(int, QtGui.QImage)
+    failed = QtCore.pyqtSignal(int, str)
+
+class PreviewTask(QtCore.QRunnable):
+    def __init__(self, generation, preset, image_path, logo_path, max_size, signals):
+        super().__init__()
+        self.generation = generation
+        self.preset = preset
+        self.image_path = image_path
+        self.logo_path = logo_path
+        self.max_size = max_size
+        self.signals = signals
+
+    def run(self):
+        try:
+            img = render_preview(self.preset, self.image_path, self.logo_path, self.max_size).convert("RGBA")
+            data = img.tobytes("raw", "RGBA")
+            qimage = QtGui.QImage(data, img.width, img.height, img.width * 4, QtGui.QImage.Format.Format_RGBA8888).copy()
+            self.signals.rendered.emit(self.generation, qimage)
+        except Exception as e:
+            self.signals.failed.emit(self.generation, f"{type(e).__name__}: {e}")
+
+class LogoSignals(QtCore.QObject):
+    found = QtCore.pyqtSignal(int, str, QtGui.QImage)
+
+class LogoLoader(QtCore.QRunnable):
+    # Lists the logo folder and loads each logo's cached thumbnail off the GUI
+    # thread; logos are reported one by one as they are ready
+    def __init__(self, generation, folder, cache, signals):
+        super().__init__()
+        self.generation = generation
+        self.folder = folder
+        self.cache = cache
+        self.signals = signals
+
+    def run(self):
+        thumb_paths = []
+        try:
+            for path in scan_images(self.folder):
+                image = QtGui.QImage()
+                try:
+                    thumb_path = self.cache.get(path)
+                    thumb_paths.append(thumb_path)
+                    image = QtGui.QImage(thumb_path)
+                except (OSError, SyntaxError, ValueError):
+                    # Still listed, just without a thumbnail
+                    pass
+                self.signals.found.emit(self.generation, os.path.relpath(path, self.folder), image)
+        except OSError:
+            # No logo folder
+            return
+        self.cache.prune(thumb_paths)
 
 class BorderPresetGUI(QtWidgets.QWidget):
     def __init__(self):
@@ -13,6 +120,45 @@ class BorderPresetGUI(QtWidgets.QWidget):
         self.user_settings = self.load_user_settings()
         self.logo_folder = "./logo"
 
+        # Logos load in the background; the saved choice is applied once it appears
+        self.logo_generation = 0
+        self.logo_thumbnails = {}
+        self.pending_logo = self.user_settings.get("last_used_logo", "")
+        self.thumbnail_cache = ThumbnailCache(size=(self.logo_preview.width(), self.logo_preview.height()))
+        self.logo_pool = QtCore.QThreadPool(self)
+        self.logo_pool.setMaxThreadCount(1)
+        self.logo_signals = LogoSignals()
+        self.logo_signals.found.connect(self.on_logo_found)
+        self.batch_thread = None
+        self.batch_started = 0.0
+
+        # Live preview: re-render shortly after the last field change, one render at a time
+        self.preview_generation = 0
+        # (input folder, its first image), so the folder is listed once per
+        # folder change rather than on every preview
+        self.preview_sample = ("", "")
+        self.preview_pool = QtCore.QThreadPool(self)
+        self.preview_pool.setMaxThreadCount(1)
+        self.preview_signals = PreviewSignals()
+        self.preview_signals.rendered.connect(self.on_preview_rendered)
+        self.preview_signals.failed.connect(self.on_preview_failed)
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(200)
+        self.preview_timer.timeout.connect(self.update_live_preview)
+
+        # Settings are written once things settle, not on every combo change
+        self.settings_timer = QtCore.QTimer(self)
+        self.settings_timer.setSingleShot(True)
+        self.settings_timer.setInterval(500)
+        self.settings_timer.timeout.connect(self.save_user_settings)
+
+        # Pick up presets edited outside the GUI
+        self.presets_timer = QtCore.QTimer(self)
+        self.presets_timer.setInterval(2000)
+        self.presets_timer.timeout.connect(self.check_presets_changed)
+        self.presets_timer.start()
+
         self.initUI()
         self.apply_styles()
 
@@ -68,9 +214,36 @@ class BorderPresetGUI(QtWidgets.QWidget):
         return {"last_used_preset": "", "last_used_logo": "", "input_folder": "", "output_folder": ""}
 
     def save_user_settings(self):
-        settings_path = 'user_settings.json'
-        with open(settings_path, 'w') as f:
-            json.dump(self.user_settings, f, indent=4)
+        self.settings_timer.stop()
+        write_atomic('user_settings.json', json.dumps(self.user_settings, indent=4).encode())
+
+    def schedule_settings_save(self):
+        self.settings_timer.start()
+
+    def closeEvent(self, event):
+        # Write anything still waiting on a timer
+        if self.settings_timer.isActive():
+            self.save_user_settings()
+        self.preset_manager.save_presets()
+        super().closeEvent(event)
+
+    def check_presets_changed(self):
+        changed = self.preset_manager.store.reload_if_changed()
+        if not changed:
+            return
+        current = self.preset_combo.currentText()
+        names = list(self.preset_manager.presets)
+        if names != [self.preset_combo.itemText(i) for i in range(self.preset_combo.count())]:
+            self.preset_combo.blockSignals(True)
+            self.preset_combo.clear()
+            self.preset_combo.addItems(names)
+            self.preset_combo.setCurrentText(current)
+            self.preset_combo.blockSignals(False)
+            if self.preset_combo.currentText() != current:
+                self.on_preset_select()
+                return
+        if current in changed and current in self.preset_manager.presets:
+            self.update_parameter_values(self.preset_manager.presets[current])
 
     def initUI(self):
         self.setWindowTitle("Image Border Preset Manager")
@@ -82,10 +255,11 @@ class BorderPresetGUI(QtWidgets.QWidget):
 
         # Logo selection combo box (from logo folder)
         self.logo_combo = QtWidgets.QComboBox(self)
+        self.logo_combo.setIconSize(QtCore.QSize(46, 20))
         self.logo_combo.currentIndexChanged.connect(self.update_logo_preview)
+        # A choice made while logos are still loading wins over the saved one
+        self.logo_combo.activated.connect(self.on_logo_chosen)
         self.update_logo_combo()
-        if self.user_settings["last_used_logo"]:
-            self.logo_combo.setCurrentText(self.user_settings["last_used_logo"])
         left_layout.addWidget(QtWidgets.QLabel("Select Logo:"))
         left_layout.addWidget(self.logo_combo)
 
@@ -130,7 +304,35 @@ class BorderPresetGUI(QtWidgets.QWidget):
         self.signature_options_frame.setLayout(signature_options_layout)
         right_layout.addWidget(self.signature_options_frame)
         self.create_signature_options_entries(signature_options_layout)
+
+        # Output encoding options
+        self.output_options_frame = QtWidgets.QGroupBox("Output")
+        output_options_layout = QtWidgets.QFormLayout()
+        self.output_options_frame.setLayout(output_options_layout)
+        right_layout.addWidget(self.output_options_frame)
+        self.create_output_options_entries(output_options_layout)
         top_layout.addLayout(right_layout)
+
+        # Live preview of the current parameters on a sample image
+        preview_frame = QtWidgets.QGroupBox("Preview")
+        preview_layout = QtWidgets.QVBoxLayout()
+        preview_frame.setLayout(preview_layout)
+        self.preview_label = QtWidgets.QLabel(self)
+        self.preview_label.setFixedSize(360, 300)
+        self.preview_label.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+        self.preview_label.setWordWrap(True)
+        preview_layout.addWidget(self.preview_label)
+        preview_image_btn = QtWidgets.QPushButton("Choose Sample Image", self)
+        preview_image_btn.clicked.connect(self.browse_preview_image)
+        preview_layout.addWidget(preview_image_btn)
+        top_layout.addWidget(preview_frame, alignment=QtCore.Qt.AlignmentFlag.AlignTop)
+
+        # Re-render the preview whenever a parameter changes
+        for var in self.param_vars.values():
+            if isinstance(var, QtWidgets.QLineEdit):
+                var.textChanged.connect(self.schedule_preview)
+            elif isinstance(var, QtWidgets.QCheckBox):
+                var.toggled.connect(self.schedule_preview)
         main_layout.addLayout(top_layout)
 
         # Folders selection
@@ -154,14 +356,81 @@ class BorderPresetGUI(QtWidgets.QWidget):
         self.delete_input_checkbox = QtWidgets.QCheckBox("Delete input files after processing", self)
         main_layout.addWidget(self.delete_input_checkbox)
 
-        # Process folder button
-        folder_process_btn = QtWidgets.QPushButton("Process All in Folder", self)
-        folder_process_btn.clicked.connect(self.process_all_images_in_folder)
-        main_layout.addWidget(folder_process_btn)
-
-        # Progress bar
+        # Subfolders are scanned while processing runs and mirrored in the output
+        self.recursive_checkbox = QtWidgets.QCheckBox("Include subfolders (mirrored in the output folder)", self)
+        self.recursive_checkbox.setChecked(self.user_settings.get("recursive", False))
+        main_layout.addWidget(self.recursive_checkbox)
+        self.include_edit = QtWidgets.QLineEdit(self)
+        self.include_edit.setPlaceholderText("e.g. IMG_*, 2024/*.jpg (empty: all)")
+        self.include_edit.setText(self.user_settings.get("include_patterns", ""))
+        self.exclude_edit = QtWidgets.QLineEdit(self)
+        self.exclude_edit.setPlaceholderText("e.g. raw, *_thumb.*")
+        self.exclude_edit.setText(self.user_settings.get("exclude_patterns", ""))
+        patterns_layout = QtWidgets.QHBoxLayout()
+        patterns_layout.addWidget(QtWidgets.QLabel("Include:"))
+        patterns_layout.addWidget(self.include_edit)
+        patterns_layout.addWidget(QtWidgets.QLabel("Exclude:"))
+        patterns_layout.addWidget(self.exclude_edit)
+        main_layout.addLayout(patterns_layout)
+
+        # Skip files already processed with the same input, preset, logo and font
+        self.manifest_checkbox = QtWidgets.QCheckBox("Skip unchanged files (keep a manifest in the output folder)", self)
+        self.manifest_checkbox.setChecked(self.user_settings.get("use_manifest", False))
+        main_layout.addWidget(self.manifest_checkbox)
+
+        # Optional fan-out: several presets/sizes/formats from one decode per image
+        self.renditions_edit = QtWidgets.QLineEdit(self)
+        self.renditions_edit.setPlaceholderText("e.g. LOGO, Signature:1600, Signature+LOGO:1024:WEBP (empty: current preset only)")
+        self.renditions_edit.setText(self.user_settings.get("renditions", ""))
+        main_layout.addWidget(QtWidgets.QLabel("Renditions (PRESET[:MAX_SIZE[:FORMAT]], comma-separated):"))
+        main_layout.addWidget(self.renditions_edit)
+
+        # Opt-in per-stage timings, written to the output folder
+        self.profile_checkbox = QtWidgets.QCheckBox("Write per-stage timing report (border_profile.json)", self)
+        main_layout.addWidget(self.profile_checkbox)
+
+        # Worker count for batch processing
+        self.workers_spin = QtWidgets.QSpinBox(self)
+        self.workers_spin.setRange(1, max(64, default_worker_count()))
+        self.workers_spin.setValue(self.user_settings.get("workers", default_worker_count()))
+        workers_layout = QtWidgets.QHBoxLayout()
+        workers_layout.addWidget(QtWidgets.QLabel("Workers:"))
+        workers_layout.addWidget(self.workers_spin)
+        # Separate reader/writer threads help on network shares; 0 is off
+        self.io_threads_spin = QtWidgets.QSpinBox(self)
+        self.io_threads_spin.setRange(0, 32)
+        self.io_threads_spin.setValue(self.user_settings.get("io_threads", 0))
+        workers_layout.addWidget(QtWidgets.QLabel("I/O threads:"))
+        workers_layout.addWidget(self.io_threads_spin)
+        # Large images get fewer workers so the batch stays within this; 0 is off
+        self.ram_budget_spin = QtWidgets.QSpinBox(self)
+        self.ram_budget_spin.setRange(0, 1024 * 1024)
+        self.ram_budget_spin.setSingleStep(512)
+        self.ram_budget_spin.setSuffix(" MB")
+        self.ram_budget_spin.setSpecialValueText("off")
+        self.ram_budget_spin.setValue(self.user_settings.get("ram_budget_mb", 0))
+        workers_layout.addWidget(QtWidgets.QLabel("RAM budget:"))
+        workers_layout.addWidget(self.ram_budget_spin)
+        main_layout.addLayout(workers_layout)
+
+        # Process folder and cancel buttons
+        self.folder_process_btn = QtWidgets.QPushButton("Process All in Folder", self)
+        self.folder_process_btn.clicked.connect(self.process_all_images_in_folder)
+        self.cancel_btn = QtWidgets.QPushButton("Cancel", self)
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        self.cancel_btn.setEnabled(False)
+        process_layout = QtWidgets.QHBoxLayout()
+        process_layout.addWidget(self.folder_process_btn)
+        process_layout.addWidget(self.cancel_btn)
+        main_layout.addLayout(process_layout)
+
+        # Progress bar with live throughput and ETA
         self.progress_bar = QtWidgets.QProgressBar(self)
-        main_layout.addWidget(self.progress_bar)
+        self.rate_label = QtWidgets.QLabel("", self)
+        progress_layout = QtWidgets.QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.rate_label)
+        main_layout.addLayout(progress_layout)
 
         # Restore last used preset
         last_preset = self.user_settings["last_used_preset"]
@@ -173,18 +442,86 @@ class BorderPresetGUI(QtWidgets.QWidget):
         self.setLayout(main_layout)
 
     def update_logo_combo(self):
-        logo_folder = self.logo_folder  # Update this path to your logo folder
-        logos = [f for f in os.listdir(logo_folder) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
+        # Items are added by on_logo_found as the background scan finds them
+        self.logo_generation += 1
+        self.logo_thumbnails = {}
         self.logo_combo.clear()
-        self.logo_combo.addItems(logos)
-        self.update_logo_preview()
+        self.logo_pool.start(LogoLoader(self.logo_generation, self.logo_folder, self.thumbnail_cache, self.logo_signals))
+
+    def on_logo_chosen(self, index):
+        self.pending_logo = ""
+
+    def on_logo_found(self, generation, name, image):
+        # Drop results from a scan that a newer one has replaced
+        if generation != self.logo_generation:
+            return
+        self.logo_thumbnails[name] = image
+        icon = QtGui.QIcon(QtGui.QPixmap.fromImage(image)) if not image.isNull() else QtGui.QIcon()
+        self.logo_combo.addItem(icon, name)
+        if name == self.pending_logo:
+            self.pending_logo = ""
+            self.logo_combo.setCurrentText(name)
 
     def update_logo_preview(self):
-        logo_folder = self.logo_folder  # Update this path to your logo folder
-        logo_path = os.path.join(logo_folder, self.logo_combo.currentText())
-        pixmap = QtGui.QPixmap(logo_path)
-        self.logo_preview.setPixmap(pixmap.scaled(self.logo_preview.size(), QtCore.Qt.AspectRatioMode.KeepAspectRatio))
+        # Shown from the cached thumbnail, never the full-resolution logo
+        image = self.logo_thumbnails.get(self.logo_combo.currentText())
+        if image is None or image.isNull():
+            self.logo_preview.clear()
+        else:
+            self.logo_preview.setPixmap(QtGui.QPixmap.fromImage(image).scaled(self.logo_preview.size(), QtCore.Qt.AspectRatioMode.KeepAspectRatio,
+                                                                              QtCore.Qt.TransformationMode.SmoothTransformation))
         self.logo_preview.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+        self.schedule_preview()
+
+    def preview_image_path(self):
+        # The chosen sample, or else the first image in the input folder
+        path = self.user_settings.get("preview_image", "")
+        if path and os.path.isfile(path):
+            return path
+        folder = self.input_folder.text() if hasattr(self, "input_folder") else ""
+        sample_folder, sample = self.preview_sample
+        if folder != sample_folder or (sample and not os.path.isfile(sample)):
+            sample = next(scan_images(folder, recursive=False), "") if folder and os.path.isdir(folder) else ""
+            self.preview_sample = (folder, sample)
+        return sample
+
+    def browse_preview_image(self):
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select Sample Image", "", "Image files (*.jpg *.jpeg *.png)")
+        if filename:
+            self.user_settings["preview_image"] = filename
+            self.save_user_settings()
+            self.schedule_preview()
+
+    def schedule_preview(self):
+        self.preview_timer.start()
+
+    def update_live_preview(self):
+        image_path = self.preview_image_path()
+        if not image_path:
+            self.preview_label.setText("Choose a sample image or an input folder to see a preview")
+            return
+        try:
+            preset = self.get_parameter_values()
+        except ValueError:
+            # Fields are mid-edit (e.g. an empty logo size); wait for the next change
+            return
+        logo_path = os.path.join(self.logo_folder, self.logo_combo.currentText())
+        self.preview_generation += 1
+        size = self.preview_label.size()
+        self.preview_pool.start(PreviewTask(self.preview_generation, preset, image_path, logo_path,
+                                            (size.width(), size.height()), self.preview_signals))
+
+    def on_preview_rendered(self, generation, qimage):
+        # Drop renders that a newer change has already superseded
+        if generation != self.preview_generation:
+            return
+        pixmap = QtGui.QPixmap.fromImage(qimage)
+        self.preview_label.setPixmap(pixmap.scaled(self.preview_label.size(), QtCore.Qt.AspectRatioMode.KeepAspectRatio,
+                                                   QtCore.Qt.TransformationMode.SmoothTransformation))
+
+    def on_preview_failed(self, generation, error):
+        if generation == self.preview_generation:
+            self.preview_label.setText(f"Preview failed: {error}")
 
     def create_parameter_entries(self, layout):
         parameters = [
@@ -231,11 +568,35 @@ class BorderPresetGUI(QtWidgets.QWidget):
         self.param_vars["modify_signature"] = QtWidgets.QCheckBox(self)
         layout.addRow("modify_signature", self.param_vars["modify_signature"])
 
+    def create_output_options_entries(self, layout):
+        # Widget names map onto keys of the preset's "output" options
+        choices = {
+            "output_format": ["", "JPEG", "PNG", "WEBP"],
+            "output_profile": ["", "fast", "small"],
+            "subsampling": ["", "4:4:4", "4:2:2", "4:2:0", "keep"],
+        }
+        for param in OUTPUT_FIELDS:
+            if param in choices:
+                var = QtWidgets.QComboBox(self)
+                var.addItems(choices[param])
+            elif param in ("progressive", "optimize", "keep_metadata"):
+                var = QtWidgets.QCheckBox(self)
+                if param != "keep_metadata":
+                    # Partly checked: up to the profile
+                    var.setTristate(True)
+            else:
+                var = QtWidgets.QLineEdit(self)
+                if param == "quality":
+                    var.setPlaceholderText("default, 1-95 or keep")
+            self.param_vars[param] = var
+            layout.addRow(param, var)
+
     def select_color(self, param):
         color = QtWidgets.QColorDialog.getColor()
         if color.isValid():
             self.param_vars[param].setStyleSheet(f"background-color: {color.name()}")
             self.param_vars[param].setText(color.name())
+            self.schedule_preview()
 
     def browse_image(self):
         filename, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select Image File", "", "Image files (*.jpg *.jpeg *.png)")
@@ -246,8 +607,11 @@ class BorderPresetGUI(QtWidgets.QWidget):
         folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Select Input Folder", "")
         if folder:
             self.input_folder.setText(folder)
+            # Chosen again: look for a sample afresh
+            self.preview_sample = ("", "")
             self.user_settings["input_folder"] = folder
             self.save_user_settings()
+            self.schedule_preview()
 
     def browse_output_folder(self):
         folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Select Output Folder", "")
@@ -263,7 +627,7 @@ class BorderPresetGUI(QtWidgets.QWidget):
             self.update_parameter_values(preset)
         # Store last used preset
         self.user_settings["last_used_preset"] = preset_name
-        self.save_user_settings()
+        self.schedule_settings_save()
 
     def update_parameter_values(self, preset):
         for param, var in self.param_vars.items():
@@ -273,6 +637,17 @@ class BorderPresetGUI(QtWidgets.QWidget):
                 var.setText(str(preset["logo_size"][1]))
             elif param == "include_signature":
                 var.setChecked(preset[param])
+            elif param in OUTPUT_FIELDS:
+                value = dict(default_output_options(), **preset.get("output", {}))[OUTPUT_FIELDS[param]]
+                if isinstance(var, QtWidgets.QComboBox):
+                    var.setCurrentText(value)
+                elif isinstance(var, QtWidgets.QCheckBox):
+                    if value == "":
+                        var.setCheckState(QtCore.Qt.CheckState.PartiallyChecked)
+                    else:
+                        var.setChecked(value)
+                else:
+                    var.setText(str(value))
             elif param in preset.get("signature_options", {}):
                 if isinstance(var, QtWidgets.QPushButton):
                     var.setStyleSheet(f"background-color: {preset['signature_options'][param]}")
@@ -289,11 +664,20 @@ class BorderPresetGUI(QtWidgets.QWidget):
     def get_parameter_values(self):
         values = {}
         signature_options = {}
+        output_options = {}
         for param, var in self.param_vars.items():
             if param == "logo_size_w" or param == "logo_size_h":
                 continue
             if param == "include_signature":
                 values[param] = var.isChecked()
+            elif param in OUTPUT_FIELDS:
+                if isinstance(var, QtWidgets.QComboBox):
+                    output_options[OUTPUT_FIELDS[param]] = var.currentText()
+                elif isinstance(var, QtWidgets.QCheckBox):
+                    partly = var.checkState() == QtCore.Qt.CheckState.PartiallyChecked
+                    output_options[OUTPUT_FIELDS[param]] = "" if partly else var.isChecked()
+                else:
+                    output_options[OUTPUT_FIELDS[param]] = var.text()
             elif param in ["first_half_text", "first_half_color", "first_half_font_size", "second_half_text", "second_half_color", "second_half_font_size", "modify_signature"]:
                 if isinstance(var, QtWidgets.QPushButton):
                     signature_options[param] = var.text()
@@ -308,25 +692,34 @@ class BorderPresetGUI(QtWidgets.QWidget):
             int(self.param_vars["logo_size_h"].text())
         ]
         values["signature_options"] = signature_options
+        values["output"] = output_options
         return values
 
     def save_preset(self, process:bool=False):
         preset_name = self.preset_combo.currentText()
         if not preset_name:
             QtWidgets.QMessageBox.critical(self, "Error", "Please select or create a preset name")
-            return
-        self.preset_manager.presets[preset_name] = self.get_parameter_values()
-        self.preset_manager.save_presets()
+            return False
+        try:
+            # Written in the background; unchanged presets aren't rewritten
+            self.preset_manager.set_preset(preset_name, self.get_parameter_values())
+        except ValueError as e:
+            QtWidgets.QMessageBox.critical(self, "Error", f"Invalid preset: {e}")
+            return False
         if not process:
             QtWidgets.QMessageBox.information(self, "Success", "Preset saved successfully!")
+        return True
 
     def new_preset(self):
         name, ok = QtWidgets.QInputDialog.getText(self, "New Preset", "Enter preset name:")
         if ok and name:
-            self.preset_manager.presets[name] = self.get_parameter_values()
+            try:
+                self.preset_manager.set_preset(name, self.get_parameter_values())
+            except ValueError as e:
+                QtWidgets.QMessageBox.critical(self, "Error", f"Invalid preset: {e}")
+                return
             self.preset_combo.addItem(name)
             self.preset_combo.setCurrentText(name)
-            self.preset_manager.save_presets()
 
     def process_all_images_in_folder(self):
         folder = self.input_folder.text()
@@ -335,23 +728,93 @@ class BorderPresetGUI(QtWidgets.QWidget):
             QtWidgets.QMessageBox.critical(self, "Error", "Please select both input and output folders")
             return
         # Save the current preset
-        self.save_preset(process=True)
+        if not self.save_preset(process=True):
+            return
         # Use logo from combo
         logo_path = os.path.join(self.logo_folder, self.logo_combo.currentText())
 
         preset_name = self.preset_combo.currentText()
         delete_input = self.delete_input_checkbox.isChecked()
-        image_files = [f for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
-        total_files = len(image_files)
-        self.progress_bar.setMaximum(total_files)
+        try:
+            renditions = parse_renditions(self.renditions_edit.text())
+        except ValueError as e:
+            QtWidgets.QMessageBox.critical(self, "Error", f"Invalid renditions: {e}")
+            return
+        unknown = [r.preset_name for r in renditions if r.preset_name not in self.preset_manager.presets]
+        if unknown:
+            QtWidgets.QMessageBox.critical(self, "Error", f"Unknown preset(s) in renditions: {', '.join(unknown)}")
+            return
+        if renditions and self.manifest_checkbox.isChecked():
+            QtWidgets.QMessageBox.critical(self, "Error", "Skipping unchanged files is not available with renditions")
+            return
+        # Streamed: processing starts while the folder is still being listed.
+        # The bar stays busy until the first file finishes.
+        recursive = self.recursive_checkbox.isChecked()
+        include = [p.strip() for p in self.include_edit.text().split(",") if p.strip()]
+        exclude = [p.strip() for p in self.exclude_edit.text().split(",") if p.strip()]
+        image_files = scan_images(folder, recursive, include, exclude, skip=[output])
+        self.progress_bar.setMaximum(0)
         self.progress_bar.setValue(0)
 
-        for i, filename in enumerate(image_files):
-            in_path = os.path.join(folder, filename)
-            self.preset_manager.apply_preset(preset_name, in_path, logo_path, output, delete_input)
-            self.progress_bar.setValue(i + 1)
+        # Remember the worker count and manifest choice for next time
+        workers = self.workers_spin.value()
+        use_manifest = self.manifest_checkbox.isChecked()
+        self.user_settings["workers"] = workers
+        self.user_settings["io_threads"] = self.io_threads_spin.value()
+        self.user_settings["ram_budget_mb"] = self.ram_budget_spin.value()
+        self.user_settings["use_manifest"] = use_manifest
+        self.user_settings["renditions"] = self.renditions_edit.text()
+        self.user_settings["recursive"] = recursive
+        self.user_settings["include_patterns"] = self.include_edit.text()
+        self.user_settings["exclude_patterns"] = self.exclude_edit.text()
+        self.save_user_settings()
 
-        QtWidgets.QMessageBox.information(self, "Done", "All images processed!")
+        # Run the batch off the GUI thread so the window stays responsive
+        engine = BatchEngine(self.preset_manager.presets, workers, io_threads=self.io_threads_spin.value(),
+                             ram_budget=self.ram_budget_spin.value() * 1024 * 1024 or None)
+        manifest = BatchManifest(output) if use_manifest else None
+        profiler = Profiler() if self.profile_checkbox.isChecked() else None
+        self.batch_thread = BatchThread(engine, preset_name, image_files, logo_path, output, delete_input, manifest, profiler, renditions,
+                                        folder if recursive else None)
+        self.batch_thread.progress.connect(self.on_batch_progress)
+        self.batch_thread.finished_batch.connect(self.on_batch_finished)
+        self.folder_process_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.rate_label.setText("")
+        self.batch_started = time.monotonic()
+        self.batch_thread.start()
+
+    def cancel_processing(self):
+        if self.batch_thread is not None and self.batch_thread.isRunning():
+            self.batch_thread.engine.cancel()
+            self.cancel_btn.setEnabled(False)
+
+    def on_batch_progress(self, done, total):
+        # total counts the files found so far; it grows while the folder is
+        # still being scanned and excludes files the manifest skips
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        elapsed = time.monotonic() - self.batch_started
+        if elapsed > 0:
+            rate = done / elapsed
+            eta = int((total - done) / rate) if rate else 0
+            self.rate_label.setText(f"{rate:.1f} img/s, ETA {eta // 60}:{eta % 60:02d}")
+
+    def on_batch_finished(self, errors, cancelled):
+        self.folder_process_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        if self.progress_bar.maximum() == 0:
+            # Nothing was found, so the bar is still in its busy state
+            self.progress_bar.setMaximum(1)
+        if errors:
+            details = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in errors[:20])
+            if len(errors) > 20:
+                details += f"\n... and {len(errors) - 20} more"
+            QtWidgets.QMessageBox.warning(self, "Done", f"{len(errors)} image(s) failed:\n{details}")
+        elif cancelled:
+            QtWidgets.QMessageBox.information(self, "Cancelled", "Processing was cancelled.")
+        else:
+            QtWidgets.QMessageBox.information(self, "Done", "All images processed!")
 
     def run(self):
         self.show()
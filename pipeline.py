@@ -0,0 +1,177 @@
+from atomic_io import write_atomic
+from instrumentation import add_stage
+from queue import Queue
+import os
+import threading
+import time
+
+# Marks a file whose work was cancelled before it started
+_CANCELLED = object()
+
+class IOPipeline:
+    # Overlaps reading, compositing and writing for storage with high latency.
+    # Reader threads prefetch input bytes, a compositing callable turns them
+    # into encoded outputs (normally on a process pool), and writer threads
+    # store those through temp-file-and-rename. At most `prefetch` files are
+    # held in memory between reading and writing, and an input is only
+    # deleted after all of its outputs have been written and synced.
+    def __init__(self, submit, output_folder, delete_input=False, io_threads=4, prefetch=None, cancelled=None, governor=None, estimate=None):
+        # submit(image_path, data) returns a concurrent.futures.Future that
+        # resolves to (image_path, error, [(output name, bytes)], record).
+        # output_folder is a folder or a function mapping an input to one.
+        self.submit = submit
+        self.folder_for = output_folder if callable(output_folder) else (lambda image_path: output_folder)
+        self.delete_input = delete_input
+        self.io_threads = max(1, io_threads)
+        self.prefetch = max(1, prefetch or self.io_threads * 2)
+        self.cancelled = cancelled or (lambda: False)
+        # Optional governor.MemoryGovernor: files are only handed to the
+        # workers once estimate(image_path, data) fits its budget
+        self.governor = governor
+        self.estimate = estimate
+
+    def results(self, image_paths):
+        # Yields (image_path, error, record) as each file is finished.
+        # image_paths may be any iterable; it is consumed by the reader
+        # threads as they go, so a streamed scan is never held in full.
+        paths = iter(image_paths)
+        paths_lock = threading.Lock()
+        read_queue = Queue(self.prefetch)
+        write_queue = Queue()
+        result_queue = Queue()
+        slots = threading.BoundedSemaphore(self.prefetch)
+        # Set when the consumer stops early (an exception in its loop, Ctrl-C,
+        # a closed generator): no new files are read or submitted, and only
+        # those already with the workers are finished
+        stop = threading.Event()
+
+        errors = []
+
+        def next_path():
+            with paths_lock:
+                if stop.is_set() or self.cancelled() or errors:
+                    return None
+                try:
+                    return next(paths, None)
+                except Exception as e:
+                    # Discovery failed; finish what was started, then re-raise
+                    errors.append(e)
+                    return None
+
+        def read():
+            while True:
+                image_path = next_path()
+                if image_path is None:
+                    read_queue.put(None)
+                    return
+                slots.acquire()
+                start = time.perf_counter()
+                try:
+                    with open(image_path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    data = e
+                read_queue.put((image_path, data, time.perf_counter() - start))
+
+        def dispatch():
+            # Forwards files until every reader has run out, then reports how
+            # many results to expect. The count is posted even if this thread
+            # fails, or results() would wait for it forever.
+            submitted = 0
+            running = self.io_threads
+            try:
+                while running:
+                    item = read_queue.get()
+                    if item is None:
+                        running -= 1
+                        continue
+                    submitted += 1
+                    image_path, data, read_seconds = item
+                    if stop.is_set():
+                        slots.release()
+                        result_queue.put((image_path, _CANCELLED, None))
+                        continue
+                    if isinstance(data, OSError):
+                        slots.release()
+                        result_queue.put((image_path, f"{type(data).__name__}: {data}", None))
+                        continue
+                    # What this file holds in the governor; None until admitted
+                    cost = None
+                    try:
+                        if self.governor is not None and self.estimate is not None:
+                            estimated = self.estimate(image_path, data)
+                            self.governor.acquire(estimated)
+                            cost = estimated
+                        future = self.submit(image_path, data)
+                    except Exception as e:
+                        # E.g. the pool broke; this file fails, the rest go on
+                        if cost is not None:
+                            self.governor.release(cost)
+                        slots.release()
+                        result_queue.put((image_path, f"{type(e).__name__}: {e}", None))
+                        continue
+                    future.add_done_callback(lambda f, p=image_path, s=read_seconds, n=len(data), c=cost: write_queue.put((p, f, s, n, c)))
+            finally:
+                result_queue.put(submitted)
+
+        def write():
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    return
+                image_path, future, read_seconds, read_bytes, cost = item
+                if cost is not None:
+                    self.governor.release(cost)
+                if future.cancelled():
+                    slots.release()
+                    result_queue.put((image_path, _CANCELLED, None))
+                    continue
+                try:
+                    _, error, outputs, record = future.result()
+                except Exception as e:
+                    # The worker process itself failed
+                    error, outputs, record = f"{type(e).__name__}: {e}", [], None
+                if record is not None:
+                    add_stage(record, "read", read_seconds, read_bytes)
+                if error is None:
+                    start = time.perf_counter()
+                    written = 0
+                    try:
+                        for name, data in outputs:
+                            write_atomic(os.path.join(self.folder_for(image_path), name), data, sync=self.delete_input)
+                            written += len(data)
+                        if self.delete_input:
+                            os.remove(image_path)
+                    except OSError as e:
+                        error = f"{type(e).__name__}: {e}"
+                    if record is not None:
+                        add_stage(record, "write", time.perf_counter() - start, written)
+                slots.release()
+                result_queue.put((image_path, error, record))
+
+        readers = [threading.Thread(target=read, daemon=True) for _ in range(self.io_threads)]
+        writers = [threading.Thread(target=write, daemon=True) for _ in range(self.io_threads)]
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        for thread in readers + writers + [dispatcher]:
+            thread.start()
+        try:
+            received = 0
+            expected = None
+            while expected is None or received < expected:
+                item = result_queue.get()
+                if isinstance(item, int):
+                    expected = item
+                    continue
+                received += 1
+                image_path, error, record = item
+                if error is not _CANCELLED:
+                    yield image_path, error, record
+        finally:
+            stop.set()
+            dispatcher.join()
+            for _ in writers:
+                write_queue.put(None)
+            for thread in readers + writers:
+                thread.join()
+        if errors:
+            raise errors[0]
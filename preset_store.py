@@ -0,0 +1,318 @@
+from atomic_io import write_atomic
+from encoder import EncoderSettings
+import hashlib
+import json
+import os
+import threading
+
+# Kind of every preset field. Values are coerced once when a preset is
+# loaded or saved, so numbers the GUI keeps as text are not re-parsed for
+# every image. Top-level fields are required; option fields are checked
+# when present (their defaults live in RenderPlan and EncoderSettings).
+PRESET_SCHEMA = {
+    "border_width": "count",
+    "extra_bottom_height": "count",
+    "font_size": "font_size",
+    "signature_text": "text",
+    "font_path": "text",
+    "include_signature": "flag",
+    "logo_size": "logo_size",
+}
+SIGNATURE_SCHEMA = {
+    "first_half_text": "text",
+    "first_half_font_size": "optional_font_size",
+    "second_half_text": "text",
+    "second_half_font_size": "optional_font_size",
+    "first_half_color": "text",
+    "second_half_color": "text",
+    "modify_signature": "flag",
+}
+OUTPUT_SCHEMA = {
+    "format": "text",
+    "profile": "text",
+    "quality": "quality",
+    "subsampling": "text",
+    "progressive": "optional_flag",
+    "optimize": "optional_flag",
+    "compress_level": "optional_count",
+    "keep_metadata": "flag",
+}
+
+def _whole_number(value, minimum):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str):
+        value = int(value.strip())
+    elif not isinstance(value, int):
+        raise ValueError
+    if value < minimum:
+        raise ValueError
+    return value
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError
+
+def _coerce(field, kind, value):
+    try:
+        if kind == "count":
+            return _whole_number(value, 0)
+        if kind == "font_size":
+            return _whole_number(value, 1)
+        if kind == "quality" and isinstance(value, str) and value.strip().lower() == "keep":
+            return "keep"
+        if kind in ("optional_count", "optional_font_size", "quality"):
+            # Empty means "use the default"
+            if value in ("", None):
+                return ""
+            return _whole_number(value, 1 if kind == "optional_font_size" else 0)
+        if kind == "optional_flag":
+            # Empty means "up to the profile"
+            return "" if value in ("", None) else _flag(value)
+        if kind == "flag":
+            return _flag(value)
+        if kind == "logo_size":
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise ValueError
+            return [_whole_number(value[0], 0), _whole_number(value[1], 0)]
+        if not isinstance(value, str):
+            raise ValueError
+        return value
+    except (TypeError, ValueError):
+        expected = {
+            "count": "a whole number of 0 or more",
+            "font_size": "a whole number of 1 or more",
+            "optional_count": "empty or a whole number of 0 or more",
+            "optional_font_size": "empty or a whole number of 1 or more",
+            "quality": 'empty, "keep" or a whole number of 0 or more',
+            "flag": "true or false",
+            "optional_flag": "empty, true or false",
+            "logo_size": "a [width, height] pair",
+            "text": "text",
+        }[kind]
+        raise ValueError(f"{field} must be {expected}, not {value!r}") from None
+
+def normalize_preset(preset):
+    # A copy of preset with every known field coerced to its kind. Raises
+    # ValueError naming the offending field; unknown fields are kept as-is.
+    if not isinstance(preset, dict):
+        raise ValueError("a preset must be a JSON object")
+    normalized = dict(preset)
+    for field, kind in PRESET_SCHEMA.items():
+        if field not in preset:
+            raise ValueError(f"missing field {field!r}")
+        normalized[field] = _coerce(field, kind, preset[field])
+    for group, schema in (("signature_options", SIGNATURE_SCHEMA), ("output", OUTPUT_SCHEMA)):
+        if group not in preset:
+            continue
+        options = preset[group]
+        if not isinstance(options, dict):
+            raise ValueError(f"{group} must be a JSON object")
+        normalized[group] = dict(options, **{field: _coerce(field, kind, options[field]) for field, kind in schema.items() if field in options})
+    # Format, profile and subsampling names
+    EncoderSettings.from_preset(normalized)
+    return normalized
+
+def content_hash(preset):
+    # Stable across processes and key order; for normalized presets "50" and
+    # 50 hash the same
+    return hashlib.sha256(json.dumps(preset, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+class PresetStore:
+    # Presets kept in one JSON file, or one "<name>.json" file per preset when
+    # path is a folder, so large collections only rewrite what changed.
+    # Presets are normalized on load and on set(). set() only marks a preset
+    # dirty; it is written `delay` seconds after the last change (None: only
+    # on flush()), through a temp file and a rename. reload_if_changed()
+    # picks up edits other programs made to the files.
+    def __init__(self, path='presets.json', defaults=None, delay=1.0):
+        self.path = path
+        self.delay = delay
+        self.is_folder = os.path.isdir(path)
+        # name -> normalized preset; updated in place, so it can be shared
+        self.presets = {}
+        self.hashes = {}
+        # name -> why the preset (or its file) was skipped
+        self.errors = {}
+        self._invalid = {}
+        self._fragments = {}
+        self._stamps = {}
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.RLock()
+        self.reload_if_changed(strict=True)
+        if not self.is_folder and not self._stamps and defaults:
+            # No presets file yet; it is only written once something is saved
+            for name, preset in defaults.items():
+                self._put(name, normalize_preset(preset))
+
+    def _put(self, name, preset):
+        self.presets[name] = preset
+        self.hashes[name] = content_hash(preset)
+        self._fragments.pop(name, None)
+        self._invalid.pop(name, None)
+        self.errors.pop(name, None)
+
+    def _preset_path(self, name):
+        if not name or name.startswith(".") or any(c in name for c in '/\\:*?"<>|'):
+            raise ValueError(f"{name!r} can't be used as a preset file name")
+        return os.path.join(self.path, name + ".json")
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _changed_files(self):
+        # {name: raw preset, or None if its file is gone} for the files that
+        # changed since they were last read or written
+        if not self.is_folder:
+            stamp = self._stamp(self.path)
+            if stamp is None or stamp == self._stamps.get(self.path):
+                return {}
+            data = self._read(self.path)
+            if not isinstance(data, dict):
+                raise ValueError(f"{self.path} must hold a JSON object of presets")
+            self._stamps[self.path] = stamp
+            updates = {name: None for name in list(self.presets) + list(self._invalid) if name not in data}
+            updates.update(data)
+            return updates
+
+        updates = {}
+        seen = set()
+        with os.scandir(self.path) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                # Temp files of an interrupted write start with a dot
+                name, ext = os.path.splitext(entry.name)
+                if ext.lower() != ".json" or name.startswith(".") or not entry.is_file():
+                    continue
+                seen.add(entry.path)
+                stat = entry.stat()
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                if self._stamps.get(entry.path) == stamp:
+                    continue
+                self._stamps[entry.path] = stamp
+                try:
+                    updates[name] = self._read(entry.path)
+                except ValueError as e:
+                    self.errors[name] = f"invalid JSON: {e}"
+        for path in [path for path in self._stamps if path not in seen]:
+            del self._stamps[path]
+            updates[os.path.splitext(os.path.basename(path))[0]] = None
+        return updates
+
+    def reload_if_changed(self, strict=False):
+        # Re-reads presets whose files changed on disk and returns the names
+        # that were added, changed or removed. Unsaved local changes win over
+        # the file. A file that can't be parsed leaves the loaded presets as
+        # they were (with strict, the error is raised instead).
+        with self._lock:
+            try:
+                updates = self._changed_files()
+            except (OSError, ValueError) as e:
+                if strict:
+                    raise ValueError(f"can't load presets from {self.path}: {e}") from e
+                self.errors[self.path] = str(e)
+                return set()
+            self.errors.pop(self.path, None)
+            changed = set()
+            for name, raw in updates.items():
+                if name in self._dirty:
+                    continue
+                if raw is None:
+                    if self.presets.pop(name, None) is not None:
+                        changed.add(name)
+                    self.hashes.pop(name, None)
+                    self._fragments.pop(name, None)
+                    self._invalid.pop(name, None)
+                    self.errors.pop(name, None)
+                    continue
+                try:
+                    preset = normalize_preset(raw)
+                except ValueError as e:
+                    # Skipped, but kept so saving the file doesn't drop it
+                    self.errors[name] = str(e)
+                    self._invalid[name] = raw
+                    if self.presets.pop(name, None) is not None:
+                        changed.add(name)
+                    self.hashes.pop(name, None)
+                    continue
+                if self.hashes.get(name) != content_hash(preset):
+                    self._put(name, preset)
+                    changed.add(name)
+            return changed
+
+    def set(self, name, preset):
+        # Validates, normalizes and stores preset, then schedules a write.
+        # Returns False if nothing changed; raises ValueError if invalid.
+        preset = normalize_preset(preset)
+        if self.is_folder:
+            self._preset_path(name)
+        with self._lock:
+            if self.hashes.get(name) == content_hash(preset):
+                return False
+            self._put(name, preset)
+            self._dirty.add(name)
+            self._schedule()
+        return True
+
+    def _schedule(self):
+        if self.delay is None:
+            return
+        if self.delay <= 0:
+            self.flush()
+            return
+        # Restarted on every change, so a burst of edits is written once
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _serialize(self):
+        # The whole presets file, laid out like json.dump(..., indent=4).
+        # Presets are serialized once and reused until they change.
+        parts = []
+        for name, preset in list(self.presets.items()) + list(self._invalid.items()):
+            fragment = self._fragments.get(name)
+            if fragment is None:
+                fragment = json.dumps(preset, indent=4).replace("\n", "\n    ")
+                if name in self.presets:
+                    self._fragments[name] = fragment
+            parts.append(f"    {json.dumps(name)}: {fragment}")
+        return "{\n" + ",\n".join(parts) + "\n}" if parts else "{}"
+
+    def _write(self, path, text):
+        # Temp file and rename, so readers never see half a file
+        write_atomic(path, text.encode())
+        self._stamps[path] = self._stamp(path)
+
+    def flush(self):
+        # Writes pending changes now
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            if self.is_folder:
+                for name in sorted(self._dirty):
+                    self._write(self._preset_path(name), json.dumps(self.presets[name], indent=4))
+            else:
+                self._write(self.path, self._serialize())
+            self._dirty.clear()
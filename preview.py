@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from PIL import Image
+from render_plan import RenderPlan, scale_preset
+import os
+import threading
+
+class SampleCache:
+    # Downscaled sample images keyed on (path, mtime, max_size). JPEGs are
+    # decoded in draft mode, which lets libjpeg skip most of the work.
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, image_path, max_size):
+        key = (os.path.abspath(image_path), os.path.getmtime(image_path), max_size)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        with Image.open(image_path) as img:
+            full_width = img.width
+            img.draft(img.mode, max_size)
+            sample = img.copy()
+        sample.thumbnail(max_size)
+        entry = (sample, sample.width / full_width)
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+sample_cache = SampleCache()
+
+def render_preview(preset, image_path, logo_path, max_size):
+    # Renders preset onto a reduced-size copy of image_path; max_size bounds
+    # the sample photo, not the bordered result
+    sample, factor = sample_cache.get(image_path, tuple(max_size))
+    plan = RenderPlan.from_preset(scale_preset(preset, factor), logo_path)
+    return plan.render(sample)
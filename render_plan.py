@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from PIL import Image
+from asset_cache import font_cache, logo_cache
+from backends import PILLOW
+from encoder import EncoderSettings
+from instrumentation import NULL_TIMER
+import copy
+import threading
+
+SCALED_FIELDS = ("border_width", "extra_bottom_height", "font_size")
+SCALED_SIGNATURE_FIELDS = ("first_half_font_size", "second_half_font_size")
+
+def _scale(value, factor, minimum):
+    if value in ("", None):
+        return value
+    return max(minimum, round(int(value) * factor))
+
+def scale_preset(preset, factor):
+    # Same preset with every pixel size multiplied by factor, for photos
+    # resized by a rendition or downscaled for the preview
+    scaled = copy.deepcopy(preset)
+    for name in SCALED_FIELDS:
+        if name in scaled:
+            scaled[name] = _scale(scaled[name], factor, 0 if name != "font_size" else 1)
+    signature_options = scaled.get("signature_options", {})
+    for name in SCALED_SIGNATURE_FIELDS:
+        if name in signature_options:
+            signature_options[name] = _scale(signature_options[name], factor, 1)
+    width, height = map(int, scaled["logo_size"])
+    if (width, height) != (0, 0):
+        scaled["logo_size"] = [max(1, round(width * factor)), max(1, round(height * factor))]
+    return scaled
+
+@dataclass(frozen=True)
+class RenderPlan:
+    # Everything in a preset that does not depend on the photo, coerced once.
+    # signature_parts holds (text, font_size, color) for each drawn piece.
+    border_width: int
+    extra_bottom_height: int
+    logo_path: str
+    logo_size: tuple
+    include_signature: bool
+    font_path: str
+    modify_signature: bool
+    signature_parts: tuple
+    encoder: EncoderSettings = EncoderSettings()
+    max_strips: int = 8
+    _strips: OrderedDict = field(default_factory=OrderedDict, init=False, compare=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, compare=False, repr=False)
+
+    @classmethod
+    def from_preset(cls, preset, logo_path):
+        font_size = int(preset["font_size"])
+        include_signature = preset["include_signature"]
+        signature_options = preset.get("signature_options", {})
+        modify_signature = signature_options.get("modify_signature", True)
+        signature_parts = ()
+        if include_signature:
+            if modify_signature:
+                signature_parts = (
+                    (signature_options.get("first_half_text", ""),
+                     int(signature_options.get("first_half_font_size", font_size)),
+                     signature_options.get("first_half_color", "black")),
+                    (signature_options.get("second_half_text", ""),
+                     int(signature_options.get("second_half_font_size", font_size)),
+                     signature_options.get("second_half_color", "black")),
+                )
+            else:
+                signature_parts = ((preset["signature_text"], font_size, "black"),)
+        return cls(
+            border_width=int(preset["border_width"]),
+            extra_bottom_height=int(preset["extra_bottom_height"]),
+            logo_path=logo_path,
+            logo_size=tuple(map(int, preset["logo_size"])),
+            include_signature=include_signature,
+            font_path=preset["font_path"],
+            modify_signature=modify_signature,
+            signature_parts=signature_parts,
+            encoder=EncoderSettings.from_preset(preset),
+        )
+
+    @property
+    def has_overlay(self):
+        return self.logo_size != (0, 0) or self.include_signature
+
+    def canvas_size(self, width, height):
+        # White background with an asymmetric border
+        return width + (self.border_width * 2), height + self.border_width + (self.border_width + self.extra_bottom_height)
+
+    def render(self, main_img, timer=NULL_TIMER, backend=PILLOW):
+        # backend (see backends.py) does the compositing; modes it can't
+        # handle go through Pillow
+        if not backend.supports(main_img.mode):
+            backend = PILLOW
+        new_width, new_height = self.canvas_size(main_img.width, main_img.height)
+        with timer.stage("canvas", new_width * new_height * len(main_img.getbands())):
+            # Paste main image onto white background
+            bordered_img = backend.new_canvas(main_img.mode, (new_width, new_height), main_img, (self.border_width, self.border_width))
+
+        if self.has_overlay:
+            # The first image of each width pays for building the strip
+            with timer.stage("strip"):
+                strip = self.bottom_strip(new_width, main_img.mode, backend)
+                if strip is not None:
+                    backend.paste(bordered_img, strip, (0, new_height - strip.height))
+            if strip is None:
+                self.draw_overlay(bordered_img, timer, backend)
+        return backend.to_image(bordered_img)
+
+    def render_bands(self, main_img, band_height):
+        # Yields the bordered output as horizontal bands of at most band_height
+        # rows, built from the source and the cached bottom strip without ever
+        # allocating the full canvas. Returns None if the overlay can't be
+        # expressed as a strip; callers then fall back to render().
+        new_width, new_height = self.canvas_size(main_img.width, main_img.height)
+        strip = self.bottom_strip(new_width, main_img.mode)
+        if strip is None:
+            return None
+        return self._iter_bands(main_img, strip, new_width, new_height, max(1, band_height))
+
+    def _iter_bands(self, main_img, strip, new_width, new_height, band_height):
+        border_width = self.border_width
+        photo_bottom = border_width + main_img.height
+        strip_top = new_height - strip.height
+        for y0 in range(0, new_height, band_height):
+            y1 = min(y0 + band_height, new_height)
+            band = Image.new(main_img.mode, (new_width, y1 - y0), 'white')
+
+            # Rows of the photo that fall inside this band
+            src_top, src_bottom = max(y0, border_width), min(y1, photo_bottom)
+            if src_top < src_bottom:
+                rows = main_img.crop((0, src_top - border_width, main_img.width, src_bottom - border_width))
+                band.paste(rows, (border_width, src_top - y0))
+
+            # Rows of the bottom strip that fall inside this band
+            if y1 > strip_top:
+                rows = strip.crop((0, max(y0, strip_top) - strip_top, new_width, y1 - strip_top))
+                band.paste(rows, (0, max(y0, strip_top) - y0))
+            yield band
+
+    def bottom_strip(self, width, mode, backend=PILLOW):
+        # The bottom border with logo and signature already drawn, cached per
+        # (width, mode). Returns None when the strip can't stand in for drawing
+        # on the full canvas: palette images, or overlays reaching into the photo.
+        # Backends produce identical pixels, so whichever builds it first wins.
+        if mode in ("P", "PA"):
+            return None
+        key = (width, mode)
+        with self._lock:
+            if key in self._strips:
+                self._strips.move_to_end(key)
+                return self._strips[key]
+
+        if not backend.supports(mode):
+            backend = PILLOW
+        canvas = backend.new_canvas(mode, (width, self.border_width + self.extra_bottom_height))
+        top = self.draw_overlay(canvas, backend=backend)
+        strip = backend.to_image(canvas) if top is None or top >= 0 else None
+
+        with self._lock:
+            self._strips[key] = strip
+            while len(self._strips) > self.max_strips:
+                self._strips.popitem(last=False)
+        return strip
+
+    def draw_overlay(self, img, timer=NULL_TIMER, backend=PILLOW):
+        # Draws logo and signature relative to the bottom edge of img (a
+        # backend canvas) and returns the topmost y touched, or None if
+        # nothing was drawn
+        main_width, main_height = img.size
+        border_width = self.border_width
+        extra_bottom_height = self.extra_bottom_height
+        top = None
+
+        # Open the logo if logo size is not zero
+        if self.logo_size != (0, 0):
+            with timer.stage("logo"):
+                logo, mask = logo_cache.get(self.logo_path, self.logo_size)
+                # Calculate logo position (left side in bottom border area for preset1, center for preset2)
+                if self.include_signature:
+                    logo_position = (border_width + 20, main_height - extra_bottom_height)
+                else:
+                    logo_position = ((main_width - logo.width) // 2, main_height - extra_bottom_height)
+
+                backend.blend(img, logo, logo_position, mask)
+            top = logo_position[1]
+
+        if self.include_signature:
+            with timer.stage("text"):
+                text_top = self._draw_signature(img, backend)
+            top = text_top if top is None else min(top, text_top)
+
+        return top
+
+    def _draw_signature(self, img, backend=PILLOW):
+        # Draws the signature and returns the topmost y its text reaches
+        main_width, main_height = img.size
+        border_width = self.border_width
+        extra_bottom_height = self.extra_bottom_height
+
+        # Draw a customizable signature
+        draw = backend.text_draw(img)
+        if self.modify_signature:
+            (first_half_text, first_half_font_size, first_half_color), (second_half_text, second_half_font_size, second_half_color) = self.signature_parts
+
+            # Load fonts (cached per process)
+            first_half_font = font_cache.font(self.font_path, first_half_font_size)
+            second_half_font = font_cache.font(self.font_path, second_half_font_size)
+
+            # Calculate positions
+            first_half_bbox = font_cache.textbbox(draw, first_half_text, self.font_path, first_half_font_size)
+            second_half_bbox = font_cache.textbbox(draw, second_half_text, self.font_path, second_half_font_size)
+            total_width = (first_half_bbox[2] - first_half_bbox[0]) + (second_half_bbox[2] - second_half_bbox[0])
+            max_height = max(first_half_bbox[3], second_half_bbox[3])
+            first_half_position = ((main_width - total_width) // 2, main_height - extra_bottom_height - border_width // 2 + (extra_bottom_height - max_height) // 2 + (max_height - first_half_bbox[3]))
+            second_half_position = (first_half_position[0] + (first_half_bbox[2] - first_half_bbox[0]), main_height - extra_bottom_height - border_width // 2 + (extra_bottom_height - max_height) // 2 + (max_height - second_half_bbox[3]))
+
+            # Draw texts
+            backend.draw_text(img, draw, first_half_position, first_half_text, first_half_font, first_half_color)
+            backend.draw_text(img, draw, second_half_position, second_half_text, second_half_font, second_half_color)
+            text_top = min(first_half_position[1] + min(first_half_bbox[1], 0), second_half_position[1] + min(second_half_bbox[1], 0))
+        else:
+            # Draw the signature text without modification
+            signature_text, font_size, color = self.signature_parts[0]
+            font = font_cache.font(self.font_path, font_size)
+            bbox = font_cache.textbbox(draw, signature_text, self.font_path, font_size)
+            text_width = bbox[2] - bbox[0]
+            signature_position = ((main_width - text_width) // 2, main_height - extra_bottom_height + (extra_bottom_height - bbox[3]) // 2)
+            backend.draw_text(img, draw, signature_position, signature_text, font, color)
+            text_top = signature_position[1] + min(bbox[1], 0)
+        return text_top
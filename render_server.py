@@ -0,0 +1,219 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from batch_engine import _init_worker, _render_bytes, default_worker_count
+from encoder import FORMAT_EXTENSIONS
+from PIL import UnidentifiedImageError
+import argparse
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+
+# Output formats follow the source unless the preset or request sets one,
+# so kept formats (GIF, BMP, ...) can come back too
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif", "BMP": "image/bmp", "TIFF": "image/tiff"}
+
+log = logging.getLogger("render_server")
+
+class RenderService:
+    # Renders uploaded images on a long-lived process pool, so presets, fonts
+    # and logos stay loaded between requests. At most max_pending renders are
+    # queued or running; further requests are turned away rather than piling up.
+    def __init__(self, presets, logo_path="", workers=None, max_pending=None, max_bytes=64 * 1024 * 1024, memory_budget=None, backend=None):
+        self.presets = presets
+        self.logo_path = logo_path
+        self.workers = max(1, workers or default_worker_count())
+        self.max_pending = max_pending or self.workers * 2
+        self.max_bytes = max_bytes
+        self._initargs = (presets, memory_budget, backend)
+        self.executor = self._new_pool()
+        self.pool_restarts = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+        self.failed = 0
+        self.started = time.time()
+
+    def try_acquire(self):
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self, ok):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.served += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self._initargs)
+
+    def _pool_broken(self, executor):
+        # Set by the executor once a worker has died (OOM, decoder crash);
+        # a broken pool fails every later submit
+        return bool(getattr(executor, "_broken", False))
+
+    def _live_pool(self, broken=None):
+        # The current pool, swapped for a fresh one if it is broken (or is
+        # the broken pool a caller just got an error from)
+        with self._lock:
+            if self.executor is broken or self._pool_broken(self.executor):
+                old, self.executor = self.executor, self._new_pool()
+                self.pool_restarts += 1
+                log.warning("a render worker died; restarted the process pool")
+                old.shutdown(wait=False, cancel_futures=True)
+            return self.executor
+
+    def render(self, preset_name, data, fmt=None):
+        # Returns (output format, encoded bytes). A request whose worker died
+        # fails; later ones run on a new pool.
+        executor = self._live_pool()
+        try:
+            future = executor.submit(_render_bytes, preset_name, data, self.logo_path, fmt)
+        except BrokenProcessPool:
+            # Broke since the check above
+            future = self._live_pool(executor).submit(_render_bytes, preset_name, data, self.logo_path, fmt)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._live_pool(executor)
+            raise
+
+    def health(self):
+        with self._lock:
+            return {
+                "status": "broken" if self._pool_broken(self.executor) else "ok",
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "served": self.served,
+                "failed": self.failed,
+                "pool_restarts": self.pool_restarts,
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "presets": list(self.presets),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+class RenderHandler(BaseHTTPRequestHandler):
+    # GET /health reports the service state; POST /render?preset=NAME[&format=FMT]
+    # takes the encoded image as the request body and returns the result
+    service = None
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            return self._json(404, {"error": "not found"})
+        self._json(200, self.service.health())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/render":
+            return self._json(404, {"error": "not found"})
+        query = parse_qs(url.query)
+        preset_name = query.get("preset", [""])[0]
+        fmt = query.get("format", [""])[0].upper()
+        fmt = "JPEG" if fmt == "JPG" else fmt
+        if preset_name not in self.service.presets:
+            return self._json(404, {"error": f"unknown preset {preset_name!r}"})
+        if fmt and fmt not in FORMAT_EXTENSIONS:
+            return self._json(400, {"error": f"unsupported format {fmt!r}"})
+        header = self.headers.get("Content-Length")
+        if header is None:
+            return self._json(411, {"error": "request body must be the image"})
+        # Digits only: int() would also take "-5" or "+5"
+        header = header.strip()
+        if not (header.isascii() and header.isdigit()) or not int(header):
+            return self._json(400, {"error": "Content-Length must be the image size in bytes"})
+        length = int(header)
+        if length > self.service.max_bytes:
+            return self._json(413, {"error": f"image larger than {self.service.max_bytes} bytes"})
+        if not self.service.try_acquire():
+            return self._json(503, {"error": "busy"}, {"Retry-After": "1"})
+        ok = False
+        try:
+            data = self.rfile.read(length)
+            out_fmt, result = self.service.render(preset_name, data, fmt or None)
+            ok = True
+        except UnidentifiedImageError as e:
+            return self._json(415, {"error": str(e)})
+        except Exception as e:
+            return self._json(500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            self.service.release(ok)
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(out_fmt, "application/octet-stream"))
+        self.send_header("Content-Length", str(len(result)))
+        self.end_headers()
+        self.wfile.write(result)
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.info("%s %s", self.address_string(), format % args)
+
+def make_server(service, host="127.0.0.1", port=8765):
+    handler = type("BoundRenderHandler", (RenderHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m render_server", description="Serve preset rendering over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--presets", default="presets.json", help="presets file (default: presets.json)")
+    parser.add_argument("-l", "--logo", default="", help="logo image for presets that have one")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes, 0 for one per CPU")
+    parser.add_argument("--max-pending", type=int, default=None, help="renders queued or running before requests get 503 (default: twice the workers)")
+    parser.add_argument("--max-bytes", type=int, default=64 * 1024 * 1024, help="largest accepted upload in bytes")
+    parser.add_argument("--memory-budget", type=int, default=None, help="bytes per output canvas before PNGs are streamed in bands")
+    parser.add_argument("--backend", choices=("pillow", "numpy"), default="pillow", help="compositing engine (default: pillow)")
+    args = parser.parse_args(argv)
+    from backends import get_backend
+    try:
+        get_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from pic_border_UI import default_presets
+    from preset_store import PresetStore
+    store = PresetStore(args.presets, default_presets(), delay=None)
+    for name, error in store.errors.items():
+        log.warning("skipping preset %r: %s", name, error)
+    presets = store.presets
+    service = RenderService(presets, args.logo, args.jobs or None, args.max_pending, args.max_bytes, args.memory_budget, args.backend)
+    server = make_server(service, args.host, args.port)
+    # Let service managers stop the server cleanly
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    log.info("serving on http://%s:%d with %d workers", args.host, args.port, service.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
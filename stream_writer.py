@@ -0,0 +1,62 @@
+import struct
+import zlib
+
+# PNG colour type and bytes per pixel for the modes we can stream
+PNG_MODES = {
+    "L": (0, 1),
+    "LA": (4, 2),
+    "RGB": (2, 3),
+    "RGBA": (6, 4),
+}
+
+def _chunk(fp, tag, data):
+    fp.write(struct.pack(">I", len(data)))
+    fp.write(tag)
+    fp.write(data)
+    fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+class PngStreamWriter:
+    # Writes an 8-bit PNG one horizontal band at a time, so the full output
+    # never has to exist in memory. Rows are stored unfiltered.
+    def __init__(self, fp, mode, size, compress_level=6, icc_profile=None, exif=None):
+        if mode not in PNG_MODES:
+            raise ValueError(f"cannot stream PNG in mode {mode}")
+        self.fp = fp
+        self.mode = mode
+        self.width, self.height = size
+        self.rows_written = 0
+        self._row_bytes = self.width * PNG_MODES[mode][1]
+        self._compressor = zlib.compressobj(compress_level)
+
+        fp.write(b"\x89PNG\r\n\x1a\n")
+        _chunk(fp, b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, PNG_MODES[mode][0], 0, 0, 0))
+        if icc_profile:
+            _chunk(fp, b"iCCP", b"ICC Profile\x00\x00" + zlib.compress(icc_profile))
+        if exif:
+            if exif.startswith(b"Exif\x00\x00"):
+                exif = exif[6:]
+            _chunk(fp, b"eXIf", exif)
+
+    def write_band(self, band):
+        if band.mode != self.mode or band.width != self.width:
+            raise ValueError("band does not match the output image")
+        data = band.tobytes()
+        row_bytes = self._row_bytes
+        # Filter type 0 (None) in front of every row
+        raw = b"".join(b"\x00" + data[i:i + row_bytes] for i in range(0, len(data), row_bytes))
+        compressed = self._compressor.compress(raw)
+        if compressed:
+            _chunk(self.fp, b"IDAT", compressed)
+        self.rows_written += band.height
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"wrote {self.rows_written} of {self.height} rows")
+        _chunk(self.fp, b"IDAT", self._compressor.flush())
+        _chunk(self.fp, b"IEND", b"")
+
+def write_png_bands(fp, mode, size, bands, compress_level=6, icc_profile=None, exif=None):
+    writer = PngStreamWriter(fp, mode, size, compress_level, icc_profile, exif)
+    for band in bands:
+        writer.write_band(band)
+    writer.close()
@@ -0,0 +1,32 @@
+from benchmark import FORMATS, check_parity, find_font, synthetic_logo
+from pic_border_UI import default_presets
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+# Run with: python -m unittest test_backends
+@unittest.skipIf(importlib.util.find_spec("numpy") is None, "NumPy is not installed")
+class NumpyParityTest(unittest.TestCase):
+    # The numpy backend must render every built-in preset pixel for pixel
+    # like Pillow, for each mode it handles and the ones it hands back
+    def setUp(self):
+        self.asset_dir = tempfile.mkdtemp(prefix="border_test_assets_")
+        self.addCleanup(shutil.rmtree, self.asset_dir, ignore_errors=True)
+        self.logo_path = os.path.join(self.asset_dir, "logo.png")
+        synthetic_logo(self.logo_path)
+        self.presets = default_presets()
+        for preset in self.presets.values():
+            preset["font_path"] = find_font()
+            if not preset["signature_text"]:
+                preset["signature_text"] = "Parity Signature"
+
+    def test_matches_pillow(self):
+        pairs = FORMATS + [("JPEG", "CMYK")]
+        # Small and odd-sized, so clipping and RGB's padding byte are covered
+        mismatches = check_parity(self.presets, list(self.presets), pairs, [0.05, 0.3], self.logo_path, ["numpy"])
+        self.assertEqual(mismatches, [])
+
+if __name__ == "__main__":
+    unittest.main()
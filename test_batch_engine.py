@@ -0,0 +1,79 @@
+from PIL import Image
+from batch_engine import BatchEngine
+from benchmark import find_font, synthetic_logo
+from manifest import BatchManifest
+from pic_border_UI import default_presets
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Run with: python -m unittest test_batch_engine
+class BatchTest(unittest.TestCase):
+    # Streamed batches run through the CLI in a fresh interpreter: a scan
+    # that finds nothing finishes while the engine is still starting its
+    # pool, which an already warmed-up test process would hide
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="border_test_batch_")
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        self.input_folder = os.path.join(self.folder, "in")
+        self.output_folder = os.path.join(self.folder, "out")
+        os.makedirs(os.path.join(self.input_folder, "sub"))
+        self.logo_path = os.path.join(self.folder, "logo.png")
+        synthetic_logo(self.logo_path)
+        presets = default_presets()
+        for preset in presets.values():
+            preset["font_path"] = find_font()
+        self.presets_path = os.path.join(self.folder, "presets.json")
+        with open(self.presets_path, 'w') as f:
+            json.dump(presets, f)
+
+    def add_images(self, count):
+        for index in range(count):
+            folder = self.input_folder if index % 2 else os.path.join(self.input_folder, "sub")
+            Image.new("RGB", (120, 80), (index * 40, 90, 160)).save(os.path.join(folder, f"img{index}.jpg"))
+
+    def run_cli(self, *args):
+        command = [sys.executable, "-m", "pic_border_cli", "-R", self.input_folder, "-o", self.output_folder, "-p", "LOGO",
+                   "-l", self.logo_path, "--presets", self.presets_path] + list(args)
+        process = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(process.returncode, 0, process.stderr)
+        return json.loads(process.stdout)
+
+    def test_empty_tree(self):
+        for jobs in ("1", "4"):
+            report = self.run_cli("-j", jobs)
+            self.assertEqual((report["total"], report["failed"]), (0, []))
+
+    def test_rerun_with_everything_up_to_date(self):
+        self.add_images(3)
+        report = self.run_cli("--manifest", "-j", "2")
+        self.assertEqual((report["succeeded"], report["failed"]), (3, []))
+        report = self.run_cli("--manifest", "-j", "2")
+        self.assertEqual((report["skipped"], report["succeeded"], report["failed"]), (3, 0, []))
+
+    def test_cancel_reports_finished_files(self):
+        # Files that were already running when the batch was cancelled still
+        # finish; each one written must be reported and recorded
+        self.add_images(24)
+        with open(self.presets_path, 'r') as f:
+            engine = BatchEngine(json.load(f), 4)
+        manifest = BatchManifest(self.output_folder)
+        reported = []
+        def progress(done, total):
+            reported.append(done)
+            engine.cancel()
+        os.makedirs(self.output_folder, exist_ok=True)
+        inputs = sorted(os.path.join(root, name) for root, _, names in os.walk(self.input_folder) for name in names)
+        engine.run("LOGO", inputs, self.logo_path, self.output_folder, delete_input=True, progress_callback=progress, manifest=manifest)
+        outputs = [name for name in os.listdir(self.output_folder) if name.endswith(".jpg")]
+        self.assertLess(len(outputs), len(inputs))
+        self.assertEqual(len(reported), len(outputs))
+        self.assertEqual(len(manifest.entries), len(outputs))
+        self.assertEqual(sum(len(names) for _, _, names in os.walk(self.input_folder)), len(inputs) - len(outputs))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+from PIL import Image
+from pic_border_UI import BorderPresetManager, default_presets
+import io
+import unittest
+
+# Run with: python -m unittest test_encoder
+def encoded(img, fmt, **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+class OutputEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.presets = default_presets()
+        # Border only: no logo or signature
+        self.presets["LOGO"]["logo_size"] = [0, 0]
+        self.presets["LOGO"]["include_signature"] = False
+
+    def render(self, data, output=None, fmt=None):
+        self.presets["LOGO"]["output"] = output or {}
+        return Image.open(io.BytesIO(BorderPresetManager(self.presets).render_image("LOGO", data, "", fmt)))
+
+    def test_mpo_source_keeps_its_tables(self):
+        photo = Image.effect_noise((160, 120), 40).convert("RGB")
+        source = encoded(photo, "MPO", save_all=True, append_images=[photo.rotate(10)], quality=95)
+        self.assertEqual(Image.open(io.BytesIO(source)).format, "MPO")
+        result = self.render(source)
+        self.assertEqual(result.format, "JPEG")
+        self.assertEqual(result.quantization, Image.open(io.BytesIO(source)).quantization)
+
+    def test_cmyk_source_to_other_formats(self):
+        # Converted to RGB, without the CMYK ICC profile
+        source = encoded(Image.new("CMYK", (80, 60), (10, 200, 30, 0)), "JPEG", icc_profile=b"fake cmyk profile")
+        for fmt in ("PNG", "WEBP"):
+            result = self.render(source, fmt=fmt)
+            self.assertEqual((result.format, result.mode), (fmt, "RGB"))
+            self.assertNotIn("icc_profile", result.info)
+        result = self.render(source, fmt="JPEG")
+        self.assertEqual((result.mode, result.info.get("icc_profile")), ("CMYK", b"fake cmyk profile"))
+
+    def test_explicit_false_overrides_profile(self):
+        source = encoded(Image.effect_noise((80, 60), 40).convert("RGB"), "JPEG")
+        self.assertTrue(self.render(source, {"profile": "small", "quality": 80}).info.get("progressive"))
+        result = self.render(source, {"profile": "small", "quality": 80, "progressive": False})
+        self.assertFalse(result.info.get("progressive"))
+
+if __name__ == "__main__":
+    unittest.main()
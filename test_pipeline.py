@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from governor import MemoryGovernor
+from pipeline import IOPipeline
+import os
+import shutil
+import tempfile
+import unittest
+
+# Run with: python -m unittest test_pipeline
+class IOPipelineTest(unittest.TestCase):
+    # The compositing step is a thread pool that copies each input to one
+    # output, so these only exercise the pipeline's own bookkeeping
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="border_test_pipeline_")
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        self.output_folder = os.path.join(self.folder, "out")
+        os.makedirs(self.output_folder)
+        self.paths = []
+        for index in range(20):
+            path = os.path.join(self.folder, f"img{index:02d}.jpg")
+            with open(path, 'wb') as f:
+                f.write(b"x" * (index + 1))
+            self.paths.append(path)
+        self.executor = ThreadPoolExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+
+    def submit(self, image_path, data):
+        name = os.path.basename(image_path)
+        return self.executor.submit(lambda: (image_path, None, [(name, data)], None))
+
+    def test_processes_every_file(self):
+        results = list(IOPipeline(self.submit, self.output_folder, io_threads=2).results(self.paths))
+        self.assertEqual(sorted(path for path, error, record in results), self.paths)
+        self.assertEqual(len(os.listdir(self.output_folder)), len(self.paths))
+
+    def test_consumer_stopping_early(self):
+        # Files not yet handed to the workers are left alone, inputs included
+        results = IOPipeline(self.submit, self.output_folder, delete_input=True, io_threads=2, prefetch=2).results(self.paths)
+        next(results)
+        results.close()
+        remaining = [path for path in self.paths if os.path.exists(path)]
+        self.assertGreater(len(remaining), len(self.paths) // 2)
+        self.assertEqual(len(os.listdir(self.output_folder)) + len(remaining), len(self.paths))
+
+    def test_governor_balanced(self):
+        # With and without an estimate, every admitted file is released once
+        for estimate in (None, lambda image_path, data: len(data)):
+            governor = MemoryGovernor(None)
+            list(IOPipeline(self.submit, self.output_folder, io_threads=2, governor=governor, estimate=estimate).results(self.paths))
+            self.assertEqual((governor.running, governor.in_use), (0, 0))
+
+if __name__ == "__main__":
+    unittest.main()
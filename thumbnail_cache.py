@@ -0,0 +1,47 @@
+from PIL import Image
+from atomic_io import atomic_output
+import hashlib
+import os
+
+class ThumbnailCache:
+    # Small PNG thumbnails of logos, kept on disk between sessions and keyed
+    # on (absolute path, mtime, size, thumbnail size), so an edited logo gets
+    # a fresh thumbnail. JPEGs are decoded in draft mode.
+    def __init__(self, folder=".logo_thumbnails", size=(229, 100)):
+        self.folder = folder
+        self.size = tuple(size)
+
+    def key(self, path):
+        stat = os.stat(path)
+        raw = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, path):
+        # Returns the path of the cached thumbnail, making it if needed
+        thumb_path = os.path.join(self.folder, self.key(path) + ".png")
+        if os.path.exists(thumb_path):
+            return thumb_path
+        with Image.open(path) as img:
+            img.draft("RGB", self.size)
+            img.thumbnail(self.size, Image.LANCZOS)
+            thumb = img.convert("RGBA")
+        os.makedirs(self.folder, exist_ok=True)
+        with atomic_output(thumb_path) as f:
+            thumb.save(f, format="PNG")
+        return thumb_path
+
+    def prune(self, thumb_paths):
+        # Removes every thumbnail not in thumb_paths (as returned by get for a
+        # full scan of the logo folder), so edited or deleted logos don't
+        # pile up
+        keep = {os.path.basename(path) for path in thumb_paths}
+        try:
+            entries = os.listdir(self.folder)
+        except FileNotFoundError:
+            return
+        for name in entries:
+            if name.endswith(".png") and name not in keep:
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except OSError:
+                    pass
@@ -0,0 +1,195 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from batch_engine import _init_worker, _process_image, default_worker_count
+from discovery import IMAGE_EXTENSIONS
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+log = logging.getLogger("watch_folder")
+
+def load_json(path, default):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+class FolderWatcher:
+    # Polls the input folder and feeds finished files to a long-lived process
+    # pool. Workers keep their preset manager, fonts and logos warm between
+    # files; the pool is only rebuilt when the watched preset changes on disk
+    # or a worker dies (the files it took down with it are logged as failed).
+    def __init__(self, input_folder, output_folder, preset_name, logo_path, presets_file='presets.json',
+                 workers=None, interval=1.0, settle=2.0, delete_input=False, use_manifest=False):
+        self.input_folder = input_folder
+        self.output_folder = output_folder
+        self.preset_name = preset_name
+        self.logo_path = logo_path
+        self.presets_file = presets_file
+        self.workers = max(1, workers or default_worker_count())
+        self.interval = interval
+        # Seconds a file's size and mtime must stay put before it counts as written
+        self.settle = settle
+        self.delete_input = delete_input
+        self.manifest = None
+        if use_manifest:
+            from manifest import BatchManifest
+            self.manifest = BatchManifest(output_folder)
+        self._stop_event = threading.Event()
+        self._seen = {}
+        self._done = {}
+        self._in_flight = {}
+        self._executor = None
+        self._store = None
+        self._presets = None
+        self._preset_errors = {}
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _load_presets(self):
+        # True when the watched preset changed since the workers started
+        if self._store is None:
+            from pic_border_UI import default_presets
+            from preset_store import PresetStore
+            self._store = PresetStore(self.presets_file, default_presets(), delay=None)
+            changed = True
+        else:
+            changed = self.preset_name in self._store.reload_if_changed()
+        if self._store.errors != self._preset_errors:
+            for name, error in self._store.errors.items():
+                if self._preset_errors.get(name) != error:
+                    log.warning("presets: %s: %s", name, error)
+            self._preset_errors = dict(self._store.errors)
+        if changed:
+            # A snapshot for the workers; reloads replace presets rather than
+            # editing them, so a shallow copy is enough
+            self._presets = dict(self._store.presets)
+        return changed
+
+    def _pool_broken(self):
+        # Set by the executor once a worker has died (OOM, decoder crash)
+        return bool(getattr(self._executor, "_broken", False))
+
+    def _ensure_pool(self):
+        changed = self._load_presets()
+        if changed or self._executor is None or self._pool_broken():
+            if self._executor is not None:
+                log.info("%s, restarting workers", "a worker died" if self._pool_broken() else "presets changed")
+                self._executor.shutdown(wait=True)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self._presets,))
+
+    def scan(self):
+        # Returns files whose size and mtime have been stable for `settle`
+        # seconds and that have not been processed in their current state
+        now = time.monotonic()
+        ready = []
+        current = {}
+        with os.scandir(self.input_folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                stat = entry.stat()
+                state = (stat.st_size, stat.st_mtime)
+                previous = self._seen.get(entry.path)
+                since = previous[1] if previous is not None and previous[0] == state else now
+                current[entry.path] = (state, since)
+                if now - since >= self.settle and self._done.get(entry.path) != state and entry.path not in self._in_flight:
+                    ready.append(entry.path)
+        self._seen = current
+        # Forget files that disappeared so a re-upload is picked up again
+        self._done = {path: state for path, state in self._done.items() if path in current}
+        return ready
+
+    def _submit(self, paths):
+        if self.manifest is not None:
+            pending = set(self.manifest.pending(self.preset_name, self._presets[self.preset_name], paths, self.logo_path))
+            for path in paths:
+                if path not in pending:
+                    # Already up to date from an earlier run
+                    self._done[path] = self._seen[path][0]
+            paths = [path for path in paths if path in pending]
+        for path in paths:
+            try:
+                future = self._executor.submit(_process_image, self.preset_name, path, self.logo_path, self.output_folder, self.delete_input)
+            except BrokenProcessPool:
+                # Picked up again by the next scan, on a new pool
+                return
+            self._in_flight[path] = (self._seen[path][0], future)
+
+    def _collect(self):
+        for path, (state, future) in list(self._in_flight.items()):
+            if not future.done():
+                continue
+            del self._in_flight[path]
+            if future.cancelled():
+                # Dropped on stop; still new to the next run
+                continue
+            try:
+                _, error, _ = future.result()
+            except Exception as e:
+                # The worker itself failed; not retried unless the file changes
+                error = f"{type(e).__name__}: {e}"
+            self._done[path] = state
+            if error is not None:
+                log.error("%s: %s", path, error)
+                continue
+            log.info("processed %s", path)
+            if self.manifest is not None:
+                # Saved every save_every files and on stop
+                self.manifest.record(path)
+
+    def run(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        log.info("watching %s -> %s with preset %r", self.input_folder, self.output_folder, self.preset_name)
+        try:
+            while not self._stop_event.is_set():
+                self._ensure_pool()
+                self._collect()
+                ready = self.scan()
+                if ready:
+                    self._submit(ready)
+                self._stop_event.wait(self.interval)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._collect()
+            if self.manifest is not None:
+                self.manifest.save()
+
+def main(argv=None):
+    settings = load_json('user_settings.json', {})
+    parser = argparse.ArgumentParser(prog="python -m watch_folder", description="Process new images dropped into a folder. Defaults come from user_settings.json.")
+    parser.add_argument("--input", default=settings.get("input_folder", ""), help="folder to watch")
+    parser.add_argument("--output", default=settings.get("output_folder", ""), help="output folder")
+    parser.add_argument("--preset", default=settings.get("last_used_preset", ""), help="preset name")
+    parser.add_argument("--logo", default=os.path.join("./logo", settings.get("last_used_logo", "")), help="logo image")
+    parser.add_argument("--presets", default="presets.json", help="presets file (default: presets.json)")
+    parser.add_argument("-j", "--jobs", type=int, default=settings.get("workers", 0), help="worker processes, 0 for one per CPU")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds a file must stay unchanged before processing")
+    parser.add_argument("--manifest", action="store_true", help="skip files already processed in earlier runs")
+    parser.add_argument("--delete-input", action="store_true", help="delete input files after processing")
+    args = parser.parse_args(argv)
+    if not args.input or not args.output or not args.preset:
+        parser.error("input folder, output folder and preset are required (none found in user_settings.json)")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    watcher = FolderWatcher(args.input, args.output, args.preset, args.logo, args.presets, args.jobs or None,
+                            args.interval, args.settle, args.delete_input, args.manifest)
+    # Let service managers stop the daemon cleanly
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())